@@ -0,0 +1,231 @@
+"""Micro-benchmarks of the ps_format transforms that run on every application, with a regression gate.
+
+Commands:
+    run      Print the time per record of each transform
+    save     Run, then store the results as a baseline
+    compare  Run, then exit with status 1 if any transform is slower than the baseline by more than --threshold
+
+Example:
+    python Benchmarks/bench_format.py save
+    python Benchmarks/bench_format.py compare --threshold 0.25
+
+Timings depend on the machine and Python version, so baselines are per-machine and not committed.
+Run save first on the machine that runs compare.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import fake_pyodbc
+
+# ps_core imports ps_powercampus, which needs pyodbc, but nothing here connects to a database
+fake_pyodbc.install()
+
+import synthetic
+import ps_core
+import ps_models
+import ps_powercampus
+from ps_format import (
+    format_blank_to_null,
+    format_app_generic,
+    format_app_api,
+    format_app_sql,
+    format_phone_number,
+    format_strtobool,
+)
+
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, "format_baseline.json")
+
+
+def make_cases(n, distributions, config):
+    """Return {transform name: (function, list of argument tuples)} built from n synthetic apps."""
+    generator = synthetic.AppGenerator(distributions, config)
+    apps = [app for app, actions in generator.generate(n)]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        mapping_path = os.path.join(work_dir, "recruiterMapping.xml")
+        synthetic.write_mapping(mapping_path, distributions)
+        mapping = ps_powercampus.get_recruiter_mapping(mapping_path)
+
+    settings = ps_core.Settings(config)
+    cfg_fields = config["slate_upload_active"]
+    generic = [format_app_generic(app, cfg_fields) for app in apps]
+    phones = [v for app in apps for (k, v) in app.items() if k[-6:] == "Number"]
+    bools = [
+        app[k]
+        for app in apps
+        for (k, v) in ps_models.fields.items()
+        if v["type"] == bool and k in app
+    ]
+
+    return {
+        "format_blank_to_null": (format_blank_to_null, [(app,) for app in apps]),
+        "format_app_generic": (format_app_generic, [(app, cfg_fields) for app in apps]),
+        "format_app_api": (
+            format_app_api,
+            [(app, config["defaults"]) for app in generic],
+        ),
+        "format_app_sql": (
+            format_app_sql,
+            [(app, mapping, settings.powercampus) for app in generic],
+        ),
+        "format_phone_number": (format_phone_number, [(p,) for p in phones]),
+        "format_strtobool": (format_strtobool, [(b,) for b in bools]),
+    }
+
+
+def time_case(function, cases, repeat):
+    """Return the best time per call in microseconds over repeat passes through cases."""
+    best = None
+    for r in range(repeat):
+        start = time.perf_counter()
+        for args in cases:
+            function(*args)
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+    return best / len(cases) * 1000000
+
+
+def run(args):
+    with open(args.config) as file:
+        config = json.load(file)
+    distributions = synthetic.load_distributions(args.distributions)
+    cases = make_cases(args.apps, distributions, config)
+
+    results = {}
+    for name, (function, calls) in cases.items():
+        results[name] = {
+            "calls": len(calls),
+            "us_per_call": round(time_case(function, calls, args.repeat), 3),
+        }
+        print(
+            name.ljust(24)
+            + str(results[name]["us_per_call"]).rjust(12)
+            + " us/call"
+            + str(len(calls)).rjust(10)
+            + " calls"
+        )
+
+    return {
+        "date": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.node(),
+        "apps": args.apps,
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Print each transform's change against the baseline. Returns a list of names that regressed."""
+    regressions = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            print(name.ljust(24) + "  not in baseline")
+            continue
+        before = baseline["results"][name]["us_per_call"]
+        after = result["us_per_call"]
+        change = (after - before) / before if before > 0 else 0
+        status = "ok"
+        if change > threshold:
+            status = "SLOWER"
+            regressions.append(name)
+        print(
+            name.ljust(24)
+            + str(before).rjust(12)
+            + " -> "
+            + str(after).rjust(10)
+            + " us/call "
+            + ("%+.1f%%" % (change * 100)).rjust(8)
+            + "  "
+            + status
+        )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmark ps_format transforms against a stored baseline."
+    )
+    parser.add_argument("command", choices=["run", "save", "compare"])
+    parser.add_argument(
+        "--apps", type=int, default=1000, help="synthetic apps to build inputs from"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="passes over the inputs; the fastest is reported",
+    )
+    parser.add_argument(
+        "--baseline", default=DEFAULT_BASELINE, help="baseline JSON file"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.20,
+        help="fraction slower than the baseline that fails compare, like 0.20 for 20%%",
+    )
+    parser.add_argument(
+        "--distributions",
+        help="JSON file overriding the synthetic data distributions; see Benchmarks/synthetic.py",
+    )
+    parser.add_argument(
+        "--config",
+        default=os.path.join(REPO_DIR, "config_sample.json"),
+        help="PowerSlate configuration to take field lists and defaults from",
+    )
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        if not os.path.exists(args.baseline):
+            print(
+                "No baseline at "
+                + args.baseline
+                + ". Baselines are per-machine; create one with the save command first."
+            )
+            sys.exit(1)
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        # Time the same inputs the baseline was saved with
+        args.apps = baseline["apps"]
+        args.repeat = baseline["repeat"]
+
+    current = run(args)
+
+    if args.command == "save":
+        with open(args.baseline, "w") as file:
+            json.dump(current, file, indent=2)
+        print("Baseline saved to " + args.baseline)
+
+    elif args.command == "compare":
+        print()
+        print(
+            "Compared to baseline from "
+            + baseline["date"]
+            + " (Python "
+            + baseline["python"]
+            + ")"
+        )
+        regressions = compare(current, baseline, args.threshold)
+        if len(regressions) > 0:
+            print(
+                str(len(regressions))
+                + " transform(s) more than "
+                + str(round(args.threshold * 100, 1))
+                + "% slower than the baseline: "
+                + ", ".join(regressions)
+            )
+            sys.exit(1)
@@ -0,0 +1,268 @@
+"""End-to-end benchmark of ps_core.main_sync() against local stand-ins for Slate, PowerCampus, and SQL Server.
+
+Example:
+    python Benchmarks/bench_sync.py --apps 1000 10000 100000 --sql-latency-ms 0.5 --http-latency-ms 20
+    python Benchmarks/bench_sync.py --apps 1000 --set powercampus.batch_updates=true --set fa_processing.batch=true
+"""
+
+import argparse
+import copy
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+import fake_pyodbc
+
+# pyodbc must be replaced before ps_powercampus is imported
+fake_pyodbc.install()
+
+import fake_services
+import synthetic
+import ps_core
+import ps_metrics
+import ps_snapshot
+
+
+def make_config(template, services_url, work_dir, overrides):
+    """Point a copy of config_sample.json at the fake services and a scratch directory."""
+    config = copy.deepcopy(template)
+    pc = config["powercampus"]
+    pc["api"]["url"] = services_url + "pc/"
+    pc["database_string"] = "fake"
+    pc["mapping_file_location"] = os.path.join(work_dir, "recruiterMapping.xml")
+    pc["logging"]["enabled"] = False
+    pc["autoconfigure_mappings"]["enabled"] = False
+    config["console_verbose"] = False
+    config["slate_query_apps"]["url"] = services_url + "slate/apps"
+    config["slate_upload_active"]["url"] = services_url + "slate/import/active"
+    config["slate_upload_passive"]["url"] = services_url + "slate/import/passive"
+    config["slate_upload_schools"]["url"] = services_url + "slate/import/schools"
+    config["scheduled_actions"]["enabled"] = True
+    config["scheduled_actions"]["autolearn_action_codes"] = False
+    config["scheduled_actions"]["slate_get"]["url"] = services_url + "slate/actions"
+    config["fa_checklist"]["slate_post"]["url"] = services_url + "slate/import/fa"
+    config["local_state"]["database"] = os.path.join(work_dir, "state.db")
+
+    for override in overrides:
+        path, value = override.split("=", 1)
+        node = config
+        keys = path.split(".")
+        for k in keys[:-1]:
+            node = node.setdefault(k, {})
+        node[keys[-1]] = json.loads(value)
+
+    return config
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss = rss / 1024
+    return round(rss / 1024, 1)
+
+
+def generate(n, template, distributions):
+    """Return n synthetic apps and a dict of their actions by aid."""
+    print("Generating " + str(n) + " apps...")
+    generator = synthetic.AppGenerator(distributions, template)
+    apps = []
+    actions = {}
+    for app, app_actions in generator.generate(n):
+        apps.append(app)
+        actions[app["aid"]] = app_actions
+    return apps, actions
+
+
+def run_size(apps, actions, args, template, write_mapping):
+    """Sync apps args.runs times in a fresh environment. Returns a list of result dicts.
+
+    write_mapping is called with the path recruiterMapping.xml should be written to.
+    """
+    n = len(apps)
+    database = fake_pyodbc.install(args.sql_latency_ms)
+    services = fake_services.FakeServices(
+        apps, actions, database, args.http_latency_ms
+    ).start()
+    results = []
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        write_mapping(os.path.join(work_dir, "recruiterMapping.xml"))
+        config = make_config(template, services.url, work_dir, args.set)
+        config_path = os.path.join(work_dir, "config.json")
+        with open(config_path, "w") as file:
+            json.dump(config, file, indent="\t")
+
+        ps_core.init(config_path)
+        try:
+            for run in range(args.runs):
+                totals_before = ps_metrics.totals()
+                calls_before = database.calls
+                if args.tracemalloc:
+                    tracemalloc.start()
+                start = time.perf_counter()
+                ps_core.main_sync()
+                seconds = time.perf_counter() - start
+                if args.tracemalloc:
+                    traced_peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+                    tracemalloc.stop()
+                else:
+                    traced_peak = None
+
+                totals = ps_metrics.totals()
+                round_trips = {
+                    k: v - totals_before.get(k, 0)
+                    for (k, v) in totals.items()
+                    if v != totals_before.get(k, 0)
+                }
+                results.append(
+                    {
+                        "apps": n,
+                        "run": run + 1,
+                        "seconds": round(seconds, 3),
+                        "apps_per_second": round(n / seconds, 1),
+                        "round_trips": round_trips,
+                        "procedure_calls": database.calls - calls_before,
+                        "traced_peak_mb": traced_peak and round(traced_peak, 1),
+                        "peak_rss_mb": peak_rss_mb(),
+                        "stages": {
+                            k: round(v["seconds"], 3)
+                            for (k, v) in ps_metrics.last_run()["stages"].items()
+                        },
+                    }
+                )
+                print_result(results[-1])
+        finally:
+            ps_core.de_init()
+            services.stop()
+
+    return results
+
+
+def print_result(r):
+    print(
+        "  run "
+        + str(r["run"])
+        + ": "
+        + str(r["apps"])
+        + " apps in "
+        + str(r["seconds"])
+        + "s ("
+        + str(r["apps_per_second"])
+        + " apps/s), "
+        + str(sum(r["round_trips"].values()))
+        + " round trips, peak "
+        + str(r["traced_peak_mb"] if r["traced_peak_mb"] is not None else "-")
+        + " MB traced / "
+        + str(r["peak_rss_mb"] if r["peak_rss_mb"] is not None else "-")
+        + " MB RSS"
+    )
+    for k, v in r["round_trips"].items():
+        print("    " + k.ljust(30) + str(v))
+    for k, v in r["stages"].items():
+        print("    " + k.ljust(30) + str(v) + "s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark main_sync against local stand-ins for Slate and PowerCampus."
+    )
+    parser.add_argument(
+        "--apps", type=int, nargs="+", default=[1000, 10000, 100000], help="app counts"
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=2,
+        help="syncs per app count. The first run posts every app to the Web API; later runs only update.",
+    )
+    parser.add_argument(
+        "--sql-latency-ms", type=float, default=0, help="delay per SQL round trip"
+    )
+    parser.add_argument(
+        "--http-latency-ms", type=float, default=0, help="delay per HTTP request"
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="PATH=JSON",
+        help="override a config setting, like powercampus.batch_updates=true",
+    )
+    parser.add_argument(
+        "--no-tracemalloc",
+        dest="tracemalloc",
+        action="store_false",
+        help="skip tracemalloc, which slows runs down; peak RSS is still reported",
+    )
+    parser.add_argument(
+        "--distributions",
+        help="JSON file overriding the synthetic data distributions; see Benchmarks/synthetic.py",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="SNAPSHOT",
+        help="sync the apps and actions recorded in a snapshot file instead of synthetic apps; --apps is ignored",
+    )
+    parser.add_argument(
+        "--mapping",
+        help="recruiterMapping.xml to use with --replay. By default, every recorded code value maps to itself.",
+    )
+    parser.add_argument("--output", help="append results to this JSON lines file")
+    args = parser.parse_args()
+
+    with open(os.path.join(REPO_DIR, "config_sample.json")) as file:
+        template = json.load(file)
+    distributions = synthetic.load_distributions(args.distributions)
+
+    if args.replay:
+        header, apps, actions = ps_snapshot.load(args.replay)
+        print(
+            "Replaying "
+            + str(len(apps))
+            + " apps recorded "
+            + header["started"]
+            + " from "
+            + header["url"]
+        )
+        if args.mapping:
+            write_mapping = lambda path: shutil.copyfile(args.mapping, path)
+        else:
+            observed = synthetic.observed_distributions(apps)
+            write_mapping = lambda path: synthetic.write_mapping(path, observed)
+        workloads = [(apps, actions, write_mapping)]
+    else:
+        workloads = (
+            generate(n, template, distributions)
+            + (lambda path: synthetic.write_mapping(path, distributions),)
+            for n in args.apps
+        )
+
+    for apps, actions, write_mapping in workloads:
+        results = run_size(apps, actions, args, template, write_mapping)
+        if args.output:
+            with open(args.output, "a") as file:
+                for r in results:
+                    r["date"] = datetime.datetime.now().isoformat()
+                    r["settings"] = args.set
+                    r["sql_latency_ms"] = args.sql_latency_ms
+                    r["http_latency_ms"] = args.http_latency_ms
+                    file.write(json.dumps(r) + "\n")
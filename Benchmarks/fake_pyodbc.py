@@ -0,0 +1,389 @@
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+# Stand-in for pyodbc and the [custom] stored procedures, backed by an in-memory SQLite database.
+# install() puts this module in sys.modules["pyodbc"], so it must run before ps_powercampus is imported.
+# Every execute() and commit() sleeps for LATENCY seconds to simulate a network round trip.
+
+SQL_DATABASE_NAME = 16
+LATENCY = 0.0
+DATABASE = None
+
+PROCEDURE_PATTERN = re.compile(
+    r"^\s*exec(?:ute)?\s+\[custom\]\.\[(\w+)\]", re.IGNORECASE
+)
+
+SCHEMA = """
+CREATE TABLE people (pcid TEXT PRIMARY KEY, govid TEXT);
+CREATE INDEX people_govid ON people (govid);
+CREATE TABLE applications (aid TEXT PRIMARY KEY, pcid TEXT, ra_status INTEGER, apl_status INTEGER);
+CREATE TABLE academic (
+    pcid TEXT, year TEXT, term TEXT, session TEXT, program TEXT, degree TEXT, curriculum TEXT,
+    PRIMARY KEY (pcid, year, term, session, program, degree, curriculum)
+);
+CREATE TABLE actions (
+    id INTEGER PRIMARY KEY, pcid TEXT, action_id TEXT, item TEXT, year TEXT, term TEXT, session TEXT
+);
+CREATE INDEX actions_pcid ON actions (pcid, year, term, session);
+CREATE TABLE writes (procedure TEXT, key TEXT, params TEXT, PRIMARY KEY (procedure, key));
+"""
+
+
+class Error(Exception):
+    pass
+
+
+class ProgrammingError(Error):
+    pass
+
+
+class Row(tuple):
+    """Tuple with attribute access by column name, like pyodbc.Row."""
+
+    def __new__(cls, columns, values):
+        row = super().__new__(cls, values)
+        row.columns = columns
+        return row
+
+    def __getattr__(self, name):
+        try:
+            return self[self.columns.index(name)]
+        except ValueError:
+            raise AttributeError(name)
+
+
+class Database:
+    """Shared state behind every fake connection, also used by the fake PowerCampus Web API."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cnxn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.cnxn.executescript(SCHEMA)
+        self.next_pcid = 1
+        self.calls = 0
+
+    def add_person(self, aid, govid):
+        """Create a person and an accepted application, as the Web API would. Return PEOPLE_CODE_ID."""
+        with self.lock:
+            pcid = "P" + str(self.next_pcid).zfill(9)
+            self.next_pcid += 1
+            self.cnxn.execute("INSERT INTO people VALUES (?, ?)", (pcid, govid))
+            self.cnxn.execute(
+                "INSERT OR REPLACE INTO applications VALUES (?, ?, 0, 2)", (aid, pcid)
+            )
+        return pcid
+
+    def call(self, name, params):
+        """Run one procedure. Returns (columns, rows), or None if it returns no result set."""
+        with self.lock:
+            self.calls += 1
+            handler = PROCEDURES.get(name, write)
+            return handler(self.cnxn, name, params)
+
+
+def write(cnxn, name, params):
+    # Update procedures without a bespoke stand-in upsert one row keyed by their first parameters
+    key = json.dumps(params[:2], default=str)
+    cnxn.execute(
+        "INSERT OR REPLACE INTO writes VALUES (?, ?, ?)",
+        (name, key, json.dumps(params, default=str)),
+    )
+    return None
+
+
+def sel_person_duplicate(cnxn, name, params):
+    row = cnxn.execute("SELECT 1 FROM people WHERE govid = ?", (params[0],)).fetchone()
+    return ["DuplicateFound"], [(row is not None,)]
+
+
+def sel_person_duplicate_batch(cnxn, name, params):
+    rows = []
+    for k in json.loads(params[0]):
+        row = cnxn.execute(
+            "SELECT 1 FROM people WHERE govid = ?", (k["govid"],)
+        ).fetchone()
+        rows.append((k["i"], row is not None))
+    return ["KeyIndex", "DuplicateFound"], rows
+
+
+def sel_ra_status(cnxn, name, params):
+    row = cnxn.execute(
+        "SELECT ra_status, apl_status, pcid FROM applications WHERE aid = ?",
+        (params[0],),
+    ).fetchone()
+    if row is None:
+        return ["ra_status", "apl_status", "PEOPLE_CODE_ID", "ra_errormessage"], []
+    return ["ra_status", "apl_status", "PEOPLE_CODE_ID", "ra_errormessage"], [
+        row + (None,)
+    ]
+
+
+def sel_ra_status_batch(cnxn, name, params):
+    rows = []
+    for k in json.loads(params[0]):
+        row = cnxn.execute(
+            "SELECT ra_status, apl_status, pcid FROM applications WHERE aid = ?",
+            (k["aid"],),
+        ).fetchone()
+        if row is not None:
+            rows.append((k["i"],) + row + (None,))
+    return [
+        "KeyIndex",
+        "ra_status",
+        "apl_status",
+        "PEOPLE_CODE_ID",
+        "ra_errormessage",
+    ], rows
+
+
+def upd_academic_app_info(cnxn, name, params):
+    cnxn.execute(
+        "INSERT OR IGNORE INTO academic VALUES (?, ?, ?, ?, ?, ?, ?)", params[:7]
+    )
+    return write(cnxn, name, params)
+
+
+def sel_profile(cnxn, name, params):
+    columns = [
+        "Registered",
+        "REG_VAL_DATE",
+        "CREDITS",
+        "CampusEmail",
+        "AdvisorUsername",
+        "Username",
+        "custom_1",
+        "custom_2",
+        "custom_3",
+        "custom_4",
+        "custom_5",
+        "COLLEGE_ATTEND",
+        "Withdrawn",
+    ]
+    row = cnxn.execute(
+        "SELECT pcid FROM academic WHERE pcid = ? AND year = ? AND term = ? AND session = ?"
+        + " AND program = ? AND degree = ? AND curriculum = ?",
+        params[:7],
+    ).fetchone()
+    if row is None:
+        return columns, []
+    pcid = row[0]
+    return columns, [
+        (
+            "N",
+            None,
+            "0.00",
+            pcid.lower() + "@school.edu",
+            None,
+            pcid.lower(),
+            None,
+            None,
+            None,
+            None,
+            None,
+            "NEW",
+            "N",
+        )
+    ]
+
+
+def upd_education(cnxn, name, params):
+    write(cnxn, name, params)
+    return ["OrgFound"], [(1,)]
+
+
+def sel_academic_calendar(cnxn, name, params):
+    return ["ACADEMIC_YEAR"], [(params[0],)]
+
+
+def sel_action_definition(cnxn, name, params):
+    return ["ACTION_ID"], [(params[0],)]
+
+
+def upd_action(cnxn, name, params):
+    pcid, action_id, item, year, term, session = (
+        params[0],
+        params[2],
+        params[3],
+        params[8],
+        params[9],
+        params[10],
+    )
+    row = cnxn.execute(
+        "SELECT id FROM actions WHERE pcid = ? AND action_id = ? AND item = ? AND year = ? AND term = ? AND session = ?",
+        (pcid, action_id, item, year, term, session),
+    ).fetchone()
+    if row is None:
+        cnxn.execute(
+            "INSERT INTO actions (pcid, action_id, item, year, term, session) VALUES (?, ?, ?, ?, ?, ?)",
+            (pcid, action_id, item, year, term, session),
+        )
+    return None
+
+
+def sel_actions(cnxn, name, params):
+    rows = cnxn.execute(
+        "SELECT id, action_id, item FROM actions WHERE pcid = ? AND year = ? AND term = ? AND session = ?",
+        (params[0], params[2], params[3], params[4]),
+    ).fetchall()
+    return ["ACTIONSCHEDULE_ID", "action_id", "item"], rows
+
+
+def del_action(cnxn, name, params):
+    cnxn.execute("DELETE FROM actions WHERE id = ?", (params[0],))
+    return None
+
+
+def awards(pcid):
+    return "<Awards><Award Fund='PELL' Amount='1000'/></Awards>", "Complete"
+
+
+def checklist(pcid):
+    return [("FAFSA", "Received", "2026-01-01"), ("VERIF", "Missing", "2026-01-01")]
+
+
+def sel_pf_awards(cnxn, name, params):
+    return ["XML", "tracking_status"], [awards(params[0])]
+
+
+def sel_pf_awards_batch(cnxn, name, params):
+    rows = [(k["i"],) + awards(k["pcid"]) for k in json.loads(params[0])]
+    return ["KeyIndex", "XML", "tracking_status"], rows
+
+
+def sel_pf_checklist(cnxn, name, params):
+    return ["Code", "Status", "Date"], checklist(params[0])
+
+
+def sel_pf_checklist_batch(cnxn, name, params):
+    rows = [
+        (k["i"],) + item for k in json.loads(params[0]) for item in checklist(k["pcid"])
+    ]
+    return ["KeyIndex", "Code", "Status", "Date"], rows
+
+
+PROCEDURES = {
+    "PS_selPersonDuplicate": sel_person_duplicate,
+    "PS_selPersonDuplicateBatch": sel_person_duplicate_batch,
+    "PS_selRAStatus": sel_ra_status,
+    "PS_selRAStatusBatch": sel_ra_status_batch,
+    "PS_updAcademicAppInfo": upd_academic_app_info,
+    "PS_selProfile": sel_profile,
+    "PS_updEducation": upd_education,
+    "PS_selAcademicCalendar": sel_academic_calendar,
+    "PS_selActionDefinition": sel_action_definition,
+    "PS_updAction": upd_action,
+    "PS_selActions": sel_actions,
+    "PS_delAction": del_action,
+    "PS_selPFAwardsXML": sel_pf_awards,
+    "PS_selPFAwardsXMLBatch": sel_pf_awards_batch,
+    "PS_selPFChecklist": sel_pf_checklist,
+    "PS_selPFChecklistBatch": sel_pf_checklist_batch,
+}
+
+
+class Cursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.results = []
+        self.description = None
+
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = tuple(params[0])
+        time.sleep(LATENCY)
+
+        # Batches from UpdateBatch are several EXEC statements joined by ";\n"
+        results = []
+        offset = 0
+        for statement in sql.split(";\n"):
+            n = statement.count("?")
+            args = list(params[offset : offset + n])
+            offset += n
+            match = PROCEDURE_PATTERN.match(statement)
+            if match is not None:
+                results.append(DATABASE.call(match.group(1), args))
+            elif statement.strip().upper() == "SELECT 1":
+                results.append((["1"], [(1,)]))
+            elif statement.strip().upper().startswith("INSERT INTO"):
+                # Status log table
+                results.append(None)
+            else:
+                raise ProgrammingError("Unsupported statement: " + statement[:80])
+
+        self.results = results
+        self.load()
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        for params in seq_of_params:
+            self.execute(sql, params)
+
+    def load(self):
+        result = self.results[0] if len(self.results) > 0 else None
+        if result is None:
+            self.description = None
+            self.rows = []
+        else:
+            columns, rows = result
+            self.description = [(c,) for c in columns]
+            self.rows = [Row(columns, r) for r in rows]
+
+    def nextset(self):
+        if len(self.results) <= 1:
+            self.results = []
+            return False
+        self.results = self.results[1:]
+        self.load()
+        return True
+
+    def fetchone(self):
+        if len(self.rows) == 0:
+            return None
+        return self.rows.pop(0)
+
+    def fetchall(self):
+        rows = self.rows
+        self.rows = []
+        return rows
+
+    def close(self):
+        pass
+
+
+class Connection:
+    def __init__(self, connection_string):
+        self.connection_string = connection_string
+
+    def cursor(self):
+        return Cursor(self)
+
+    def commit(self):
+        time.sleep(LATENCY)
+
+    def rollback(self):
+        pass
+
+    def getinfo(self, info_type):
+        return "fake_campus6"
+
+    def close(self):
+        pass
+
+
+def connect(connection_string):
+    return Connection(connection_string)
+
+
+def install(latency_ms=0):
+    """Replace pyodbc with this module and start from an empty database."""
+    global LATENCY
+    global DATABASE
+
+    LATENCY = latency_ms / 1000
+    DATABASE = Database()
+    sys.modules["pyodbc"] = sys.modules[__name__]
+    return DATABASE
@@ -0,0 +1,105 @@
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-ins for Slate and the PowerCampus Web API, served from one threaded HTTP server.
+#   GET  /slate/apps?pid=...      Slate applications query. pid may be comma-separated.
+#   GET  /slate/actions?aids=...  Slate scheduled actions query
+#   POST /slate/import/<name>     Slate import endpoints; the body is counted and discarded
+#   GET  /pc/api/version          PowerCampus Web API version
+#   POST /pc/api/applications     PowerCampus Web API; creates the person in the fake database
+
+
+class FakeServices:
+    """Serve synthetic Slate data and accept uploads, sleeping latency_ms per request."""
+
+    def __init__(self, apps, actions, database, latency_ms=0):
+        self.apps = apps
+        self.apps_by_pid = {}
+        for app in apps:
+            self.apps_by_pid.setdefault(app["pid"], []).append(app)
+        self.actions = actions
+        self.database = database
+        self.latency = latency_ms / 1000
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.uploaded_bytes = 0
+
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                services.handle(self, "GET")
+
+            def do_POST(self):
+                services.handle(self, "POST")
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = "http://127.0.0.1:" + str(self.httpd.server_address[1]) + "/"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def handle(self, handler, method):
+        time.sleep(self.latency)
+        url = urllib.parse.urlparse(handler.path)
+        q = urllib.parse.parse_qs(url.query)
+        length = int(handler.headers.get("Content-Length", 0))
+        body = handler.rfile.read(length) if length > 0 else b""
+
+        with self.lock:
+            key = method + " " + url.path
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.uploaded_bytes += len(body)
+
+        status = 200
+        content_type = "application/json"
+        if url.path == "/slate/apps":
+            if "pid" in q:
+                pids = q["pid"][0].split(",")
+                rows = [a for p in pids for a in self.apps_by_pid.get(p, [])]
+            else:
+                rows = self.apps
+            response = json.dumps({"row": rows})
+        elif url.path == "/slate/actions":
+            aids = q["aids"][0].split(",") if "aids" in q else []
+            response = json.dumps(
+                {"row": [a for aid in aids for a in self.actions.get(aid, [])]}
+            )
+        elif url.path.startswith("/slate/import/"):
+            response = "{}"
+        elif url.path == "/pc/api/version":
+            response = '"9.2.0"'
+        elif url.path == "/pc/api/applications" and method == "POST":
+            app = json.loads(body)
+            pcid = self.database.add_person(
+                app["ApplicationNumber"], app["GovernmentId"]
+            )
+            # Same tail as the real API, which post_api() slices the new PEOPLE_CODE_ID from
+            response = '"Application accepted. New People Id ' + pcid[1:] + '."'
+        else:
+            status = 404
+            content_type = "text/plain"
+            response = "Not found"
+
+        data = response.encode("utf8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
@@ -0,0 +1,401 @@
+"""Synthetic Slate application rows for benchmarks, shaped by ps_models.
+
+Rows are generated one at a time, so datasets of millions of apps can be streamed to JSON lines.
+Every code value a row uses is also written to a matching recruiterMapping.xml.
+
+Example:
+    python Benchmarks/synthetic.py 1000000 --output apps.jsonl.gz --actions actions.jsonl.gz --mapping recruiterMapping.xml
+"""
+
+import argparse
+import copy
+import datetime
+import gzip
+import json
+import os
+import random
+import sys
+import uuid
+import xml.etree.ElementTree as ET
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import ps_models
+
+# Lists of weights are indexed by count. For example, "education": [1, 6, 3] gives 10% of apps
+# no schools, 60% one school, and 30% two schools.
+DEFAULT_DISTRIBUTIONS = {
+    "seed": 1,
+    # Chance that a nullable field (supply_null in ps_models) is left out of a row
+    "null_rate": 0.3,
+    "year_terms": ["2026/FALL/MAIN", "2027/SPRING/MAIN", "2027/FALL/MAIN"],
+    "programs": ["UNDER", "GRAD"],
+    "degrees": ["BA/ENGL", "BS/BIOL", "BS/CHEM", "MA/HIST", "MBA/BUSI"],
+    "code_values": {
+        "Campus": ["MAIN", "ONLINE"],
+        "CitizenshipStatus": ["US", "PR", "INTL"],
+        "CollegeAttend": ["NEW", "READ"],
+        "Language": ["ENG", "SPA", "FRE"],
+        "MaritalStatus": ["S", "M"],
+        "Religion": ["NONE", "CATH", "PROT"],
+        "Veteran": ["0", "1"],
+        "Visa": ["F1", "J1"],
+    },
+    "addresses": [0, 8, 2],
+    "phones": [1, 14, 5],
+    "education": [1, 6, 3],
+    "test_scores": [4, 4, 2],
+    "score_slots": [0, 3, 4, 3],
+    "stops": [8, 2],
+    "actions": [1, 3, 4, 2],
+    # Chance that a compare_* shadow already holds the value PowerCampus will send back
+    "compare_match_rate": 0.9,
+}
+
+# Slate fields whose values are translated through a recruiterMapping.xml node
+MAPPED_FIELDS = {
+    "Campus": "Campus",
+    "CitizenshipStatus": "CitizenshipStatus",
+    "SecondaryCitizenship": "CitizenshipStatus",
+    "CollegeAttendStatus": "CollegeAttend",
+    "PrimaryLanguage": "Language",
+    "MaritalStatus": "MaritalStatus",
+    "Religion": "Religion",
+    "Veteran": "Veteran",
+    "Visa": "Visa",
+}
+
+# Filled in by Slate or by PowerSlate itself rather than generated
+SKIP_FIELDS = ["aid", "pid", "PEOPLE_CODE_ID", "YearTerm"]
+
+INT_RANGES = {"Gender": 3, "Ethnicity": 3, "SMSOptIn": 2}
+
+# Values the benchmark's fake PowerCampus profile returns, for matching compare_* shadows.
+# Booleans and integers all come back as 0.
+COMPARE_STRINGS = {"credits": "0.00"}
+
+
+def guid(kind, i):
+    """Return a stable GUID for the i'th record of a kind, so runs are repeatable."""
+    return str(
+        uuid.uuid5(uuid.NAMESPACE_URL, "powerslate-benchmark/" + kind + "/" + str(i))
+    )
+
+
+def load_distributions(path=None):
+    """Return DEFAULT_DISTRIBUTIONS, updated with a JSON file of overrides if given."""
+    distributions = copy.deepcopy(DEFAULT_DISTRIBUTIONS)
+    if path is not None:
+        with open(path) as file:
+            overrides = json.load(file)
+        distributions["code_values"].update(overrides.pop("code_values", {}))
+        distributions.update(overrides)
+    return distributions
+
+
+class AppGenerator:
+    """Generate Slate-shaped application rows and scheduled actions.
+
+    Keyword arguments:
+    distributions -- dict like DEFAULT_DISTRIBUTIONS
+    config -- PowerSlate configuration dict. Notes, user defined fields, compare_* shadows, and action codes are taken from it.
+    """
+
+    def __init__(self, distributions, config):
+        self.d = distributions
+        self.rng = random.Random(distributions["seed"])
+        self.upload_fields = {
+            "string": config["slate_upload_active"]["fields_string"],
+            "bool": config["slate_upload_active"]["fields_bool"],
+            "int": config["slate_upload_active"]["fields_int"],
+        }
+        self.extra_fields = [n["slate_field"] for n in config["powercampus"]["notes"]]
+        self.extra_fields += [
+            u["slate_field"] for u in config["powercampus"]["user_defined_fields"]
+        ]
+        self.action_ids = config["scheduled_actions"]["admissions_action_codes"]
+        self.score_model = ps_models.get_model("array", "TestScoresNumeric")
+        self.score_slots = sorted(
+            {k[5:-4] for k in self.score_model if k[:5] == "Score" and k[-4:] == "Type"}
+            - {"Alpha"},
+            key=int,
+        )
+
+    def count(self, weights):
+        return self.rng.choices(range(len(weights)), weights=weights)[0]
+
+    def chance(self, p):
+        return self.rng.random() < p
+
+    def date(self):
+        return datetime.date(
+            self.rng.randint(2020, 2026),
+            self.rng.randint(1, 12),
+            self.rng.randint(1, 28),
+        ).isoformat()
+
+    def value(self, name, field_type):
+        """Return a Slate-style string value for a ps_models field."""
+        if name in MAPPED_FIELDS:
+            return self.rng.choice(self.d["code_values"][MAPPED_FIELDS[name]])
+        if field_type == bool:
+            return self.rng.choice(["0", "1"])
+        if field_type == int:
+            return str(self.rng.randrange(INT_RANGES.get(name, 10)))
+        if "Date" in name:
+            return self.date()
+        return name + str(self.rng.randrange(1000))
+
+    def app(self, i):
+        """Return the i'th application row."""
+        app = {
+            "aid": guid("app", i),
+            "pid": guid("person", i),
+            "AppID": str(100000 + i),
+            "Ref": str(200000 + i),
+        }
+
+        for name, field in ps_models.fields.items():
+            if name in SKIP_FIELDS:
+                continue
+            if field["supply_null"] and self.chance(self.d["null_rate"]):
+                continue
+            app[name] = self.value(name, field["type"])
+
+        app["FirstName"] = "First" + str(i)
+        app["LastName"] = "Last" + str(i)
+        app["Email"] = "applicant" + str(i) + "@example.com"
+        app["GovernmentId"] = str(100000000 + i)
+        app["YearTerm"] = self.rng.choice(self.d["year_terms"])
+        app["Program"] = self.rng.choice(self.d["programs"])
+        app["Degree"] = self.rng.choice(self.d["degrees"])
+
+        # Numbered address and phone slots, like Address1Line1 and Phone1Number
+        for n in range(1, self.count(self.d["addresses"]) + 1):
+            prefix = "Address" + str(n)
+            app[prefix + "Line1"] = str(self.rng.randint(1, 9999)) + " Main St"
+            app[prefix + "City"] = "Springfield"
+            app[prefix + "StateProvince"] = "IL"
+            app[prefix + "PostalCode"] = str(self.rng.randint(10000, 99999))
+        for n in range(1, self.count(self.d["phones"]) + 1):
+            app["Phone" + str(n) + "Number"] = "555-555-" + str(
+                self.rng.randint(0, 9999)
+            ).zfill(4)
+            app["Phone" + str(n) + "Type"] = str(self.rng.randint(0, 2))
+
+        for field in self.extra_fields:
+            if not self.chance(self.d["null_rate"]):
+                app[field] = field + str(self.rng.randrange(100))
+
+        # Shadows of values previously sent back to Slate
+        for field in self.upload_fields["string"]:
+            if self.chance(self.d["compare_match_rate"]):
+                app["compare_" + field] = COMPARE_STRINGS.get(field)
+        for field in self.upload_fields["bool"]:
+            if self.chance(self.d["compare_match_rate"]):
+                app["compare_" + field] = "0"
+        for field in self.upload_fields["int"]:
+            if self.chance(self.d["compare_match_rate"]):
+                app["compare_" + field] = "0"
+
+        education = [self.school(i, n) for n in range(self.count(self.d["education"]))]
+        if len(education) > 0:
+            app["Education"] = education
+        tests = [self.test() for n in range(self.count(self.d["test_scores"]))]
+        if len(tests) > 0:
+            app["TestScoresNumeric"] = tests
+        stops = [self.stop() for n in range(self.count(self.d["stops"]))]
+        if len(stops) > 0:
+            app["Stops"] = stops
+
+        # Drop nulls, like the Slate JSON output does
+        return {k: v for (k, v) in app.items() if v is not None}
+
+    def school(self, i, n):
+        school = {
+            "GUID": guid("school", str(i) + "/" + str(n)),
+            "OrgIdentifier": str(self.rng.randint(1000, 9999)),
+        }
+        for name, field in ps_models.arrays["Education"].items():
+            if field["supply_null"] and not self.chance(self.d["null_rate"]):
+                school[name] = self.value(name, field["type"])
+        if self.chance(self.d["compare_match_rate"]):
+            school["compare_org_found"] = "1"
+        return school
+
+    def test(self):
+        test = {
+            "TestType": self.rng.choice(["ACT", "SAT", "GRE"]),
+            "TestDate": self.date(),
+        }
+        slots = self.rng.sample(
+            self.score_slots,
+            min(len(self.score_slots), max(1, self.count(self.d["score_slots"]))),
+        )
+        for slot in slots:
+            name = "Score" + slot
+            test[name + "Type"] = "SUB" + slot
+            test[name] = str(self.rng.randint(1, 36))
+        return test
+
+    def stop(self):
+        stop = {
+            "StopCode": self.rng.choice(["ADM", "FIN", "REG"]),
+            "StopDate": self.date(),
+            "Cleared": self.rng.choice(["0", "1"]),
+        }
+        if stop["Cleared"] == "1":
+            stop["ClearedDate"] = self.date()
+        return stop
+
+    def actions(self, app):
+        """Return Slate checklist items for an application, like the scheduled actions query."""
+        return [
+            {
+                "aid": app["aid"],
+                "action_id": self.rng.choice(self.action_ids),
+                "item": "Item " + str(n),
+                "scheduled_date": self.date(),
+                "completed": self.rng.choice(["N", "Y"]),
+                "completed_date": None,
+            }
+            for n in range(self.count(self.d["actions"]))
+        ]
+
+    def generate(self, n):
+        """Yield (app, actions) tuples for n applications."""
+        for i in range(n):
+            app = self.app(i)
+            yield app, self.actions(app)
+
+
+def split_code(value, n):
+    """Split a generated code like "2026/FALL/MAIN" into n PowerCampus values. Other codes map to themselves."""
+    parts = value.split("/")
+    if len(parts) != n:
+        parts = [value] * n
+    return parts
+
+
+def observed_distributions(apps):
+    """Return distributions whose code values are those used by a list of real apps, for mapping replayed data."""
+    distributions = copy.deepcopy(DEFAULT_DISTRIBUTIONS)
+    distributions["code_values"] = {v: [] for v in MAPPED_FIELDS.values()}
+    for key, field in [
+        ("year_terms", "YearTerm"),
+        ("programs", "Program"),
+        ("degrees", "Degree"),
+    ]:
+        distributions[key] = sorted({app[field] for app in apps if field in app})
+    for field, node in MAPPED_FIELDS.items():
+        values = distributions["code_values"][node]
+        values.extend(
+            {app[field] for app in apps if app.get(field) not in [None, ""]}
+            - set(values)
+        )
+    return distributions
+
+
+def write_mapping(path, distributions):
+    """Write a recruiterMapping.xml covering every code value the generator can produce."""
+    root = ET.Element("PowerCampusMapping")
+
+    for node, values in distributions["code_values"].items():
+        element = ET.SubElement(root, node, NumberOfPowerCampusFieldsMapped="1")
+        for v in values:
+            ET.SubElement(element, "row", RCCodeValue=v, PCCodeValue=v)
+
+    level = ET.SubElement(root, "AcademicLevel", NumberOfPowerCampusFieldsMapped="1")
+    for p in distributions["programs"]:
+        ET.SubElement(level, "row", RCCodeValue=p, PCCodeValue=p)
+
+    program = ET.SubElement(
+        root,
+        "AcademicProgram",
+        NumberOfPowerCampusFieldsMapped="2",
+        PCFirstField="Degree",
+        PCSecondField="Curriculum",
+    )
+    for dc in distributions["degrees"]:
+        d, c = split_code(dc, 2)
+        ET.SubElement(
+            program,
+            "row",
+            RCCodeValue=dc,
+            PCDegreeCodeValue=d,
+            PCCurriculumCodeValue=c,
+        )
+
+    term = ET.SubElement(
+        root,
+        "AcademicTerm",
+        NumberOfPowerCampusFieldsMapped="3",
+        PCFirstField="Year",
+        PCSecondField="Term",
+        PCThirdField="Session",
+    )
+    for yts in distributions["year_terms"]:
+        y, t, s = split_code(yts, 3)
+        ET.SubElement(
+            term,
+            "row",
+            RCCodeValue=yts,
+            PCYearCodeValue=y,
+            PCTermCodeValue=t,
+            PCSessionCodeValue=s,
+        )
+
+    ET.ElementTree(root).write(path, encoding="utf-8", xml_declaration=True)
+
+
+def open_output(path):
+    """Open a file for writing text, compressed if the name ends in .gz."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic Slate applications as JSON lines."
+    )
+    parser.add_argument("count", type=int, help="number of applications")
+    parser.add_argument(
+        "--output", required=True, help="applications file, one JSON row per line"
+    )
+    parser.add_argument(
+        "--actions", help="scheduled actions file, one JSON row per line"
+    )
+    parser.add_argument("--mapping", help="recruiterMapping.xml to write")
+    parser.add_argument(
+        "--distributions", help="JSON file overriding DEFAULT_DISTRIBUTIONS"
+    )
+    parser.add_argument(
+        "--config",
+        default=os.path.join(REPO_DIR, "config_sample.json"),
+        help="PowerSlate configuration to take field lists from",
+    )
+    args = parser.parse_args()
+
+    distributions = load_distributions(args.distributions)
+    with open(args.config) as file:
+        config = json.load(file)
+    generator = AppGenerator(distributions, config)
+
+    apps_file = open_output(args.output)
+    actions_file = open_output(args.actions) if args.actions else None
+    try:
+        for app, actions in generator.generate(args.count):
+            apps_file.write(json.dumps(app) + "\n")
+            if actions_file is not None:
+                for action in actions:
+                    actions_file.write(json.dumps(action) + "\n")
+    finally:
+        apps_file.close()
+        if actions_file is not None:
+            actions_file.close()
+
+    if args.mapping:
+        write_mapping(args.mapping, distributions)
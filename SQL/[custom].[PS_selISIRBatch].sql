@@ -0,0 +1,47 @@
+USE [Campus6]
+GO
+
+SET ANSI_NULLS ON
+GO
+
+SET QUOTED_IDENTIFIER ON
+GO
+
+-- =============================================
+-- Create date: 2026-10-19
+-- Description:	Set-based version of [custom].[PS_selISIR] for many government IDs in one call.
+--				@Keys is a JSON array like [{"i": 0, "govid": "123456789"}].
+--				Returns the same ISIR column as PS_selISIR, plus KeyIndex (the "i" value)
+--				so the caller can match rows back to its keys. Keys without an ISIR return no row.
+-- =============================================
+CREATE PROCEDURE [custom].[PS_selISIRBatch] @Keys NVARCHAR(max)
+AS
+BEGIN
+	SET NOCOUNT ON;
+
+	SELECT k.KeyIndex
+		,k.GovID
+	INTO #Keys
+	FROM OPENJSON(@Keys) WITH (
+			KeyIndex INT '$.i'
+			,GovID NVARCHAR(9) '$.govid'
+			) k
+
+	-- Like PS_selISIR, keep the most recent award year's ISIR for each key
+	SELECT KeyIndex
+		,ISIR
+	FROM (
+		SELECT k.KeyIndex
+			,vsd.doc_name + ' - ' + vsd.doc_status_desc + ' ' + CONVERT(NVARCHAR(50), vsd.status_effective_dt, 101) [ISIR]
+			,ROW_NUMBER() OVER (
+				PARTITION BY k.KeyIndex ORDER BY vsd.award_year_token DESC
+				) [RowNumber]
+		FROM #Keys k
+		INNER JOIN vmcnypf.PFaids.dbo.v_stu_docs vsd
+			ON vsd.student_ssn = k.GovID
+				AND vsd.doc_short_name = 'ISIR'
+		) isirs
+	WHERE RowNumber = 1
+	ORDER BY KeyIndex
+END
+GO
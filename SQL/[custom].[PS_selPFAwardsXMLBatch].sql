@@ -0,0 +1,181 @@
+USE [Campus6]
+GO
+
+SET ANSI_NULLS ON
+GO
+
+SET QUOTED_IDENTIFIER ON
+GO
+
+-- =============================================
+-- Create date: 2026-10-19
+-- Description:	Set-based version of [custom].[PS_selPFAwardsXML] for many applications in one call.
+--				@Keys is a JSON array like [{"i": 0, "pcid": "P000012345", "govid": "123456789", "year": "2026", "term": "FALL", "session": ""}].
+--				Returns the same XML and tracking_status columns as PS_selPFAwardsXML, plus KeyIndex (the "i" value)
+--				so the caller can match rows back to its keys. Keys without a PowerFAIDS award year return no rows.
+-- =============================================
+CREATE PROCEDURE [custom].[PS_selPFAwardsXMLBatch] @Keys NVARCHAR(max)
+AS
+BEGIN
+	SET NOCOUNT ON;
+
+	SELECT k.KeyIndex
+		,k.PCID
+		,k.GovID
+		,ac.FIN_AID_YEAR [FinAidYear]
+	INTO #Keys
+	FROM OPENJSON(@Keys) WITH (
+			KeyIndex INT '$.i'
+			,PCID NVARCHAR(10) '$.pcid'
+			,GovID INT '$.govid'
+			,AcademicYear NVARCHAR(4) '$.year'
+			,AcademicTerm NVARCHAR(10) '$.term'
+			,AcademicSession NVARCHAR(10) '$.session'
+			) k
+	LEFT JOIN ACADEMICCALENDAR ac
+		ON ac.ACADEMIC_YEAR = k.AcademicYear
+			AND ac.ACADEMIC_TERM = k.AcademicTerm
+			AND ac.ACADEMIC_SESSION = k.AcademicSession
+
+	--Match PowerFAIDS students with two equality joins instead of an OR, so each can be sent to the linked server as a keyed lookup
+	SELECT k.KeyIndex
+		,s.student_token
+	INTO #Students
+	FROM #Keys k
+	INNER JOIN [VMCNYPF01].[PFaids].[dbo].[student] s
+		ON s.alternate_id = k.PCID
+	
+	UNION
+	
+	SELECT k.KeyIndex
+		,s.student_token
+	FROM #Keys k
+	INNER JOIN [VMCNYPF01].[PFaids].[dbo].[student] s
+		ON s.student_ssn = k.GovID
+
+	SELECT k.KeyIndex
+		,(
+			SELECT (
+					SELECT 'fund_long_name' AS [k]
+						,fund_long_name AS [v]
+					FOR XML path('p')
+						,type
+					)
+				,(
+					SELECT 'Summer' AS [k]
+						,FORMAT(Summer, 'C0') AS [v]
+					FOR XML path('p')
+						,type
+					)
+				,(
+					SELECT 'Fall' AS [k]
+						,FORMAT(Fall, 'C0') AS [v]
+					FOR XML path('p')
+						,type
+					)
+				,(
+					SELECT 'Spring' AS [k]
+						,FORMAT(Spring, 'C0') AS [v]
+					FOR XML path('p')
+						,type
+					)
+				,(
+					SELECT 'Total' AS [k]
+						,FORMAT(Total, 'C0') AS [v]
+					FOR XML path('p')
+						,type
+					)
+			FROM (
+				--Individual awards
+				SELECT *
+					,COALESCE([Summer], 0) + COALESCE([Fall], 0) + COALESCE([Spring], 0) AS Total
+				FROM (
+					SELECT CASE 
+							WHEN net_disbursement_amount > 0
+								AND net_disbursement_amount <> scheduled_amount
+								THEN fund_long_name + ' (Net)'
+							ELSE fund_long_name
+							END [fund_long_name]
+						,CASE 
+							WHEN net_disbursement_amount > 0
+								AND net_disbursement_amount <> scheduled_amount
+								THEN net_disbursement_amount
+							ELSE scheduled_amount
+							END [amount]
+						,IIF(attend_desc = 'T-Summer', 'Summer', attend_desc) [attend_desc]
+					FROM #Students s
+					INNER JOIN [VMCNYPF01].[PFaids].[dbo].[stu_award_year] say
+						ON say.award_year_token = k.FinAidYear
+							AND s.student_token = say.student_token
+					INNER JOIN [VMCNYPF01].[PFaids].[dbo].[stu_award] sa
+						ON sa.stu_award_year_token = say.stu_award_year_token
+					INNER JOIN [VMCNYPF01].[PFaids].[dbo].[stu_award_transactions] sat
+						ON sat.stu_award_token = sa.stu_award_token
+					INNER JOIN [VMCNYPF01].[PFaids].[dbo].[funds] f
+						ON f.fund_token = sa.fund_ay_token
+					INNER JOIN [VMCNYPF01].[PFaids].[dbo].[poe]
+						ON poe.poe_token = sat.poe_token
+					WHERE s.KeyIndex = k.KeyIndex
+					) a_raw
+				PIVOT(SUM([amount]) FOR attend_desc IN (
+							[Summer]
+							,[Fall]
+							,[Spring]
+							)) xx
+				
+				UNION ALL
+				
+				--Grand total
+				SELECT *
+					,COALESCE([Summer], 0) + COALESCE([Fall], 0) + COALESCE([Spring], 0) AS Total
+				FROM (
+					SELECT 'Totals' [fund_long_name]
+						,CASE 
+							WHEN net_disbursement_amount > 0
+								AND net_disbursement_amount <> scheduled_amount
+								THEN net_disbursement_amount
+							ELSE scheduled_amount
+							END [amount]
+						,IIF(attend_desc = 'T-Summer', 'Summer', attend_desc) [attend_desc]
+					FROM #Students s
+					INNER JOIN [VMCNYPF01].[PFaids].[dbo].[stu_award_year] say
+						ON say.award_year_token = k.FinAidYear
+							AND s.student_token = say.student_token
+					INNER JOIN [VMCNYPF01].[PFaids].[dbo].[stu_award] sa
+						ON sa.stu_award_year_token = say.stu_award_year_token
+					INNER JOIN [VMCNYPF01].[PFaids].[dbo].[stu_award_transactions] sat
+						ON sat.stu_award_token = sa.stu_award_token
+					INNER JOIN [VMCNYPF01].[PFaids].[dbo].[funds] f
+						ON f.fund_token = sa.fund_ay_token
+					INNER JOIN [VMCNYPF01].[PFaids].[dbo].[poe]
+						ON poe.poe_token = sat.poe_token
+					WHERE s.KeyIndex = k.KeyIndex
+						--AND net_disbursement_amount > 0
+						--AND net_disbursement_amount <> scheduled_amount
+					) a_raw
+				PIVOT(SUM([amount]) FOR attend_desc IN (
+							[Summer]
+							,[Fall]
+							,[Spring]
+							)) xx
+				) x
+			--Remove empty lines
+			WHERE [Total] > 0
+			ORDER BY CASE fund_long_name
+					WHEN 'Totals'
+						THEN 'zzzz'
+					ELSE fund_long_name
+					END
+			FOR XML path('row')
+				,type
+			) AS [XML]
+		,tracking_status
+	FROM #Keys k
+	INNER JOIN #Students s
+		ON s.KeyIndex = k.KeyIndex
+	INNER JOIN [VMCNYPF01].[PFaids].[dbo].[stu_award_year] say
+		ON say.award_year_token = k.FinAidYear
+			AND s.student_token = say.student_token
+	ORDER BY k.KeyIndex
+END
+GO
@@ -0,0 +1,74 @@
+USE [Campus6]
+GO
+
+SET ANSI_NULLS ON
+GO
+
+SET QUOTED_IDENTIFIER ON
+GO
+
+-- =============================================
+-- Create date: 2026-10-19
+-- Description:	Set-based version of [custom].[PS_selPFChecklist] for many applications in one call.
+--				@Keys is a JSON array like [{"i": 0, "pcid": "P000012345", "govid": "123456789", "year": "2026", "term": "FALL", "session": ""}].
+--				Returns the same Code, Status, and Date columns as PS_selPFChecklist, plus KeyIndex (the "i" value)
+--				so the caller can match rows back to its keys.
+-- =============================================
+CREATE PROCEDURE [custom].[PS_selPFChecklistBatch] @Keys NVARCHAR(max)
+AS
+BEGIN
+	SET NOCOUNT ON;
+
+	SELECT k.KeyIndex
+		,k.PCID
+		,k.GovID
+		,ac.FIN_AID_YEAR [FinAidYear]
+	INTO #Keys
+	FROM OPENJSON(@Keys) WITH (
+			KeyIndex INT '$.i'
+			,PCID NVARCHAR(10) '$.pcid'
+			,GovID VARCHAR(9) '$.govid'
+			,AcademicYear NVARCHAR(4) '$.year'
+			,AcademicTerm NVARCHAR(10) '$.term'
+			,AcademicSession NVARCHAR(10) '$.session'
+			) k
+	LEFT JOIN ACADEMICCALENDAR ac
+		ON ac.ACADEMIC_YEAR = k.AcademicYear
+			AND ac.ACADEMIC_TERM = k.AcademicTerm
+			AND ac.ACADEMIC_SESSION = k.AcademicSession
+
+	--Match PowerFAIDS students with two equality joins instead of an OR, so each can use an index
+	SELECT k.KeyIndex
+		,s.student_token
+	INTO #Students
+	FROM #Keys k
+	INNER JOIN [PFaids].[dbo].[student] s
+		ON s.alternate_id = k.PCID
+	
+	UNION
+	
+	SELECT k.KeyIndex
+		,s.student_token
+	FROM #Keys k
+	INNER JOIN [PFaids].[dbo].[student] s
+		ON s.student_ssn = k.GovID
+
+	SELECT k.KeyIndex
+		,srd.doc_token [Code]
+		,doc_status_desc [Status]
+		,FORMAT(status_effective_dt, 'yyyy-MM-dd') [Date]
+	FROM #Keys k
+	INNER JOIN #Students s
+		ON s.KeyIndex = k.KeyIndex
+	INNER JOIN [PFaids].[dbo].[stu_award_year] say
+		ON say.award_year_token = k.FinAidYear
+			AND s.student_token = say.student_token
+	INNER JOIN [PFaids].[dbo].[student_required_documents] srd
+		ON say.stu_award_year_token = srd.stu_award_year_token
+	INNER JOIN [PFaids].[dbo].[docs] d
+		ON d.doc_token = srd.doc_token
+	INNER JOIN [PFaids].[dbo].[doc_status_code] dsc
+		ON dsc.doc_required_status_code = srd.doc_status
+	ORDER BY k.KeyIndex
+END
+GO
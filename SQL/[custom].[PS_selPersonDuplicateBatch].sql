@@ -0,0 +1,39 @@
+USE [Campus6]
+GO
+
+SET ANSI_NULLS ON
+GO
+
+SET QUOTED_IDENTIFIER ON
+GO
+
+-- =============================================
+-- Create date: 2026-10-19
+-- Description:	Set-based version of [custom].[PS_selPersonDuplicate] for many government IDs in one call.
+--				@Keys is a JSON array like [{"i": 0, "govid": "123456789"}].
+--				Returns the same DuplicateFound column as PS_selPersonDuplicate, plus KeyIndex (the "i" value)
+--				so the caller can match rows back to its keys.
+-- =============================================
+CREATE PROCEDURE [custom].[PS_selPersonDuplicateBatch] @Keys NVARCHAR(max)
+AS
+BEGIN
+	SET NOCOUNT ON;
+
+	SELECT k.KeyIndex
+		,CASE 
+			WHEN EXISTS (
+					SELECT *
+					FROM PEOPLE
+					WHERE GOVERNMENT_ID = k.GovernmentId
+						AND k.GovernmentId > ''
+					)
+				THEN CAST(1 AS BIT)
+			ELSE CAST(0 AS BIT)
+			END [DuplicateFound]
+	FROM OPENJSON(@Keys) WITH (
+			KeyIndex INT '$.i'
+			,GovernmentId NVARCHAR(20) '$.govid'
+			) k
+	ORDER BY k.KeyIndex
+END
+GO
@@ -0,0 +1,40 @@
+USE [Campus6]
+GO
+
+SET ANSI_NULLS ON
+GO
+
+SET QUOTED_IDENTIFIER ON
+GO
+
+-- =============================================
+-- Create date: 2026-10-19
+-- Description:	Set-based version of [custom].[PS_selRAStatus] for many ApplicationNumber GUIDs in one call.
+--				@Keys is a JSON array like [{"i": 0, "aid": "84f2060e-5d9d-437b-b5be-9558679edac4"}].
+--				Returns the same columns as PS_selRAStatus, plus KeyIndex (the "i" value)
+--				so the caller can match rows back to its keys. Applications not found return no row.
+-- =============================================
+CREATE PROCEDURE [custom].[PS_selRAStatusBatch] @Keys NVARCHAR(max)
+AS
+BEGIN
+	SET NOCOUNT ON;
+
+	SELECT k.KeyIndex
+		,PEOPLE_CODE_ID
+		,apl.PersonId AS PersonId
+		,ra.[Status] AS 'ra_status'
+		,ra.[ErrorMessage] AS 'ra_errormessage'
+		,apl.[Status] AS 'apl_status'
+	FROM OPENJSON(@Keys) WITH (
+			KeyIndex INT '$.i'
+			,ApplicationNumber UNIQUEIDENTIFIER '$.aid'
+			) k
+	INNER JOIN RecruiterApplication ra
+		ON ra.ApplicationNumber = k.ApplicationNumber
+	LEFT JOIN [Application] apl
+		ON apl.ApplicationId = ra.ApplicationId
+	LEFT JOIN PEOPLE p
+		ON p.PersonId = apl.PersonId
+	ORDER BY k.KeyIndex
+END
+GO
@@ -25,6 +25,11 @@ GRANT EXEC ON [custom].[PS_updApplicationFormSetting] to $(service_user)
 GRANT EXEC ON [custom].[PS_updStop] to $(service_user)
 GRANT EXEC ON [custom].[PS_selPFAwardsXML] to $(service_user)
 GRANT EXEC ON [custom].[PS_selAcademicCalendar] to $(service_user)
+GRANT EXEC ON [custom].[PS_selPFAwardsXMLBatch] to $(service_user)
+GRANT EXEC ON [custom].[PS_selPFChecklistBatch] to $(service_user)
+GRANT EXEC ON [custom].[PS_selISIRBatch] to $(service_user)
+GRANT EXEC ON [custom].[PS_selPersonDuplicateBatch] to $(service_user)
+GRANT EXEC ON [custom].[PS_selRAStatusBatch] to $(service_user)
 
 USE [PowerCampusMapper]
 GRANT INSERT ON PowerSlate_AppStatus_Log TO $(service_user)
@@ -1,5 +1,11 @@
 import requests
+import contextlib
 import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from ps_format import (
     format_app_generic,
@@ -8,28 +14,126 @@ from ps_format import (
     Edu_sync_result,
     Stop_from_Slate,
 )
+import ps_metrics
 import ps_powercampus
+import ps_snapshot
+import ps_state
+
+# Serializes changes to the config file and recruiterMapping.xml when syncs run concurrently.
+CONFIG_LOCK = threading.Lock()
+HTTP_SESSIONS = threading.local()
+SETTINGS = None
+
+
+class SyncBusy(Exception):
+    """Raised when every app of an on-demand sync is being synced by another process."""
+
 
 # The Settings class should replace the CONFIG global in all new code.
 class Settings:
     def __init__(self, config):
         self.fa_awards = self.FlatDict(config["fa_awards"])
+        self.fa_awards.cache = self.FlatDict(
+            config["fa_awards"].get("cache", {}),
+            {
+                "enabled": False,
+                "ttl_minutes": 1440,
+                "max_entries": 100000,
+                "force_refresh": False,
+                "bypass_on_demand": True,
+            },
+        )
+        self.fa_processing = self.FlatDict(
+            config.get("fa_processing", {}), {"batch": False, "concurrent": False}
+        )
         self.powercampus = self.PowerCampus(config["powercampus"])
         self.console_verbose = config["console_verbose"]
-        self.msg_strings = self.FlatDict(config["msg_strings"])
+        self.msg_strings = self.FlatDict(
+            config["msg_strings"],
+            {
+                "error_sync_busy": "The sync server is busy. Please try again in a few minutes.",
+                "error_sync_timeout": "The sync is taking longer than expected and is still running. Please check again in a few minutes.",
+                "sync_done_partial": "Sync completed, but some applications are being synced elsewhere and were skipped. Please try again in a few minutes.",
+            },
+        )
+        self.local_state = self.FlatDict(
+            config.get("local_state", {}), {"database": "powerslate_state.db"}
+        )
+        self.run_report = self.FlatDict(
+            config.get("run_report", {}),
+            {"enabled": False, "path": "powerslate_runs.jsonl"},
+        )
+        self.sql_trace = self.FlatDict(
+            config.get("sql_trace", {}), {"enabled": False, "slow_ms": None}
+        )
+        self.snapshot = self.FlatDict(
+            config.get("snapshot", {}),
+            {
+                "record": False,
+                "path": "slate_snapshots",
+                "redact_pii": True,
+                "redact_fields": [],
+            },
+        )
+        self.coordination = self.FlatDict(
+            config.get("coordination", {}),
+            {
+                "enabled": False,
+                "skip_unchanged_minutes": 0,
+                "lease_minutes": 30,
+                "wait_seconds": 30,
+                "chunk_size": 500,
+            },
+        )
+        self.scheduler = self.FlatDict(
+            config.get("scheduler", {}),
+            {"interval_minutes": 15, "prevent_overlap": True, "lock_ttl_minutes": 120},
+        )
+        self.http_server = self.FlatDict(
+            config.get("http_server", {}),
+            {
+                "max_concurrent_syncs": 1,
+                "handler_threads": 8,
+                "debounce_seconds": 0,
+                "async_jobs": False,
+                "poll_seconds": 2,
+                "job_ttl_seconds": 3600,
+                "max_batch_pids": 500,
+                "max_queue": 50,
+                "max_connections": 64,
+                "request_timeout_seconds": 300,
+                "retry_after_seconds": 30,
+            },
+        )
 
     class PowerCampus:
+        # Defaults for optional settings
+        defaults = {
+            "batch_updates": False,
+            "batch_duplicate_check": False,
+            "write_avoidance": {"enabled": False, "max_age_hours": None},
+            "deferred_rescan": {
+                "enabled": False,
+                "max_wait_seconds": 0,
+                "poll_seconds": 1,
+                "backoff": 2,
+            },
+        }
+
         def __init__(self, config):
+            config = self.defaults | config
             dicts = [k for k in config if type(config[k]) == dict]
             for field in config:
                 if field not in dicts:
                     setattr(self, field, config[field])
 
             for d in dicts:
-                setattr(self, d, Settings.FlatDict(config[d]))
+                setattr(self, d, Settings.FlatDict(config[d], self.defaults.get(d)))
 
     class FlatDict:
-        def __init__(self, contents):
+        def __init__(self, contents, defaults=None):
+            if defaults is not None:
+                contents = defaults | contents
             for field in contents:
                 setattr(self, field, contents[field])
 
@@ -42,26 +146,144 @@ def init(config_path):
     global RM_MAPPING
     global MSG_STRINGS
     global SETTINGS  # New global for Settings class
+    global RM_MAPPING_MTIME
 
     CONFIG_PATH = config_path
     with open(CONFIG_PATH) as file:
         CONFIG = json.loads(file.read())
     SETTINGS = Settings(CONFIG)
 
+    RM_MAPPING_MTIME = os.path.getmtime(SETTINGS.powercampus.mapping_file_location)
     RM_MAPPING = ps_powercampus.get_recruiter_mapping(
         SETTINGS.powercampus.mapping_file_location
     )
     MSG_STRINGS = CONFIG["msg_strings"]
 
+    ps_metrics.init(
+        SETTINGS.run_report.path if SETTINGS.run_report.enabled else None,
+        SETTINGS.sql_trace.enabled,
+        SETTINGS.sql_trace.slow_ms,
+    )
+    ps_snapshot.init(
+        SETTINGS.snapshot.path if SETTINGS.snapshot.record else None,
+        SETTINGS.snapshot.redact_pii,
+        SETTINGS.snapshot.redact_fields,
+    )
+
+    # Local state is opened lazily by whichever optional feature needs it first
+    ps_state.init(SETTINGS.local_state.database)
+
     # Init PowerCampus API and SQL connections
     ps_powercampus.init(SETTINGS.powercampus, SETTINGS.console_verbose, SETTINGS.msg_strings)
 
     return CONFIG
 
 
+def reload_mapping_if_changed():
+    """Re-read recruiterMapping.xml if it was modified since it was last loaded. For long-running processes."""
+    global RM_MAPPING
+    global RM_MAPPING_MTIME
+
+    mfl = SETTINGS.powercampus.mapping_file_location
+    with CONFIG_LOCK:
+        mtime = os.path.getmtime(mfl)
+        if mtime != RM_MAPPING_MTIME:
+            verbose_print("recruiterMapping.xml changed. Reloading.")
+            RM_MAPPING = ps_powercampus.get_recruiter_mapping(mfl)
+            RM_MAPPING_MTIME = mtime
+
+
 def de_init():
     """Release resources like open SQL connections."""
+    if SETTINGS is not None and SETTINGS.coordination.enabled:
+        ps_state.release_syncs(sync_owner())
     ps_powercampus.de_init()
+    ps_state.de_init()
+
+
+def http_session():
+    """Return the calling thread's HTTP session for Slate, so connections are reused between requests."""
+    session = getattr(HTTP_SESSIONS, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.hooks["response"].append(ps_metrics.count_response)
+        HTTP_SESSIONS.session = session
+    return session
+
+
+def reset_http_session():
+    """Close the calling thread's HTTP session. A new one is opened on next use."""
+    session = getattr(HTTP_SESSIONS, "session", None)
+    if session is not None:
+        HTTP_SESSIONS.session = None
+        session.close()
+
+
+def recover():
+    """Reset the calling thread's connections after a failed sync, without re-reading config.
+
+    recruiterMapping.xml is reloaded if another process changed it, such as by autoconfiguring a new program.
+    """
+    reset_http_session()
+    if SETTINGS.coordination.enabled:
+        ps_state.release_syncs(sync_owner())
+    ps_powercampus.recover()
+    reload_mapping_if_changed()
+
+
+def sync_owner():
+    """Identify the calling process and thread to other processes sharing the local state database."""
+    return (
+        socket.gethostname()
+        + ":"
+        + str(os.getpid())
+        + ":"
+        + threading.current_thread().name
+    )
+
+
+def claim_apps(apps, pid=None):
+    """Lease apps in the local state database so scheduled and on-demand syncs don't work on the same app at once.
+
+    Scheduled runs also skip apps whose Slate payload is unchanged since they were synced within skip_unchanged_minutes.
+    On-demand runs never skip, and wait up to wait_seconds for apps leased elsewhere.
+
+    Returns:
+    apps -- the claimed subset of apps
+    hashes -- dict of {aid: payload hash} for the claimed apps
+    busy -- list of aids leased elsewhere
+    """
+    settings = SETTINGS.coordination
+    hashes = {k: ps_state.fingerprint(v) for (k, v) in apps.items()}
+    if pid is None and settings.skip_unchanged_minutes:
+        skip_age = settings.skip_unchanged_minutes * 60
+    else:
+        skip_age = None
+
+    claimed, busy = ps_state.claim_syncs(
+        hashes, sync_owner(), settings.lease_minutes * 60, skip_age
+    )
+    if pid is not None:
+        deadline = time.monotonic() + settings.wait_seconds
+        while len(busy) > 0 and time.monotonic() < deadline:
+            time.sleep(1)
+            more, busy = ps_state.claim_syncs(
+                {k: hashes[k] for k in busy},
+                sync_owner(),
+                settings.lease_minutes * 60,
+            )
+            claimed.extend(more)
+
+    verbose_print(
+        "\tClaimed "
+        + str(len(claimed))
+        + " apps; "
+        + str(len(busy))
+        + " being synced elsewhere; "
+        + str(len(apps) - len(claimed) - len(busy))
+        + " unchanged since last sync"
+    )
+    return {k: apps[k] for k in claimed}, {k: hashes[k] for k in claimed}, busy
 
 
 def verbose_print(x):
@@ -85,13 +307,11 @@ def slate_get_actions(apps_list):
     Returns:
     action_list -- list of individual action as dicts
 
-    Uses its own HTTP session to reduce overhead and queries Slate with batches of 48 comma-separated ID's.
+    Reuses an HTTP session to reduce overhead and queries Slate with batches of 48 comma-separated ID's.
     48 was chosen to avoid exceeding max GET request.
     """
 
-    # Set up an HTTP session to use for multiple GET requests.
-    http_session = requests.Session()
-    http_session.auth = (
+    creds = (
         CONFIG["scheduled_actions"]["slate_get"]["username"],
         CONFIG["scheduled_actions"]["slate_get"]["password"],
     )
@@ -112,16 +332,16 @@ def slate_get_actions(apps_list):
         # Stuff them into a comma-separated string.
         qs = ",".join(str(item) for item in ql)
 
-        r = http_session.get(
-            CONFIG["scheduled_actions"]["slate_get"]["url"], params={"aids": qs}
+        r = http_session().get(
+            CONFIG["scheduled_actions"]["slate_get"]["url"],
+            params={"aids": qs},
+            auth=creds,
         )
         r.raise_for_status()
         al = json.loads(r.text)
         actions_list.extend(al["row"])
         # if len(al['row']) > 1: # Delete. I don't think an application could ever have zero actions.
 
-    http_session.close()
-
     return actions_list
 
 
@@ -135,7 +355,7 @@ def slate_post_generic(upload_list, config_dict):
     upload_dict = {"row": upload_list}
 
     creds = (config_dict["username"], config_dict["password"])
-    r = requests.post(config_dict["url"], json=upload_dict, auth=creds)
+    r = http_session().post(config_dict["url"], json=upload_dict, auth=creds)
     r.raise_for_status()
 
 
@@ -168,7 +388,7 @@ def slate_post_apps_changed(apps, config_dict):
         upload_dict = {"row": upload_list}
 
         creds = (config_dict["username"], config_dict["password"])
-        r = requests.post(config_dict["url"], json=upload_dict, auth=creds)
+        r = http_session().post(config_dict["url"], json=upload_dict, auth=creds)
         r.raise_for_status()
 
     msg = (
@@ -182,6 +402,10 @@ def slate_post_apps_changed(apps, config_dict):
 
 
 def slate_post_fields(apps, config_dict):
+    """Upload passive fields back to Slate.
+
+    If delta mode is enabled, only fields whose value changed since the last successful upload are sent.
+    """
     # Build list of flat app dicts with only certain fields included
     upload_list = []
     fields = ["aid"]
@@ -191,12 +415,66 @@ def slate_post_fields(apps, config_dict):
         CURRENT_RECORD = app["aid"]
         upload_list.append({k: v for (k, v) in app.items() if k in fields})
 
-    # Slate requires JSON to be convertable to XML
-    upload_dict = {"row": upload_list}
+    delta = config_dict.get("delta", {"enabled": False})
+    hashes = []
+    if delta["enabled"]:
+        if delta.get("max_age_hours") is not None:
+            max_age = delta["max_age_hours"] * 3600
+        else:
+            max_age = None
+
+        # Look up the saved hashes of only these fields at once: {key: (hash, checked, changed)}
+        saved = ps_state.get_hashes(
+            "slate_passive",
+            [
+                row["aid"] + "|" + k
+                for row in upload_list
+                for k in row.keys()
+                if k != "aid"
+            ],
+        )
+        now = time.time()
+
+        delta_list = []
+        for row in upload_list:
+            changed = {}
+            for k, v in row.items():
+                if k == "aid":
+                    continue
+                key = row["aid"] + "|" + k
+                digest = ps_state.fingerprint([v])
+                previous = saved.get(key)
+                if (
+                    previous is None
+                    or previous[0] != digest
+                    or (max_age is not None and now - previous[1] > max_age)
+                ):
+                    changed[k] = v
+                    hashes.append((key, digest))
+            if len(changed) > 0:
+                delta_list.append(changed | {"aid": row["aid"]})
+        upload_list = delta_list
 
-    creds = (config_dict["username"], config_dict["password"])
-    r = requests.post(config_dict["url"], json=upload_dict, auth=creds)
-    r.raise_for_status()
+    if len(upload_list) > 0:
+        # Slate requires JSON to be convertable to XML
+        upload_dict = {"row": upload_list}
+
+        creds = (config_dict["username"], config_dict["password"])
+        r = http_session().post(config_dict["url"], json=upload_dict, auth=creds)
+        r.raise_for_status()
+
+    # Only remember values once Slate has accepted them
+    if len(hashes) > 0:
+        ps_state.save_hashes("slate_passive", hashes)
+
+    msg = (
+        "\t"
+        + str(len(upload_list))
+        + " of "
+        + str(len(apps))
+        + " apps had passive fields uploaded"
+    )
+    return msg
 
 
 def slate_post_fa_checklist(upload_list):
@@ -216,7 +494,7 @@ def slate_post_fa_checklist(upload_list):
             CONFIG["fa_checklist"]["slate_post"]["username"],
             CONFIG["fa_checklist"]["slate_post"]["password"],
         )
-        r = requests.post(
+        r = http_session().post(
             CONFIG["fa_checklist"]["slate_post"]["url"],
             data=slate_fa_string,
             auth=creds,
@@ -267,37 +545,217 @@ def learn_actions(actions_list):
         if action_def is None:
             learned_actions.remove(action_id)
 
-    admissions_action_codes += learned_actions
+    with CONFIG_LOCK:
+        admissions_action_codes += [
+            k for k in learned_actions if k not in admissions_action_codes
+        ]
 
-    # Write new config
-    with open(CONFIG_PATH, mode="w") as file:
-        json.dump(CONFIG, file, indent="\t")
+        # Write new config
+        with open(CONFIG_PATH, mode="w") as file:
+            json.dump(CONFIG, file, indent="\t")
 
 
-def main_sync(pid=None):
-    """Main body of the program.
+def fa_get_awards(keys, refresh=False, pending=None):
+    """Return PowerFAIDS awards XML and Tracking Status, using the local result cache if enabled.
 
     Keyword arguments:
-    pid -- specific application GUID to sync (default None)
+    keys -- list of tuples like (pcid, govid, year, term, session)
+    refresh -- bypass cached results, but still store fresh ones
+    pending -- dict to collect fresh results in, to be stored later with fa_cache_put(), instead of storing them now
+
+    Returns:
+    dict like {key: (awards, tracking_status)}
+    """
+    cache = SETTINGS.fa_awards.cache
+    results = {}
+
+    if cache.enabled and not refresh:
+        cached = ps_state.cache_get_many("pf_awards", keys, cache.ttl_minutes * 60)
+        results.update({k: tuple(v) for (k, v) in cached.items()})
+
+    missing = [k for k in keys if k not in results]
+    if len(missing) > 0:
+        if SETTINGS.fa_processing.batch:
+            fetched = ps_powercampus.pf_get_awards_batch(missing)
+        else:
+            fetched = {k: ps_powercampus.pf_get_awards(*k) for k in missing}
+        results.update(fetched)
+
+        if pending is not None:
+            pending.update(fetched)
+        else:
+            fa_cache_put(fetched)
+
+    return results
+
+
+def fa_cache_put(fetched):
+    """Store fresh PowerFAIDS awards results in the local result cache, if enabled."""
+    cache = SETTINGS.fa_awards.cache
+    if cache.enabled and len(fetched) > 0:
+        ps_state.cache_put_many(
+            "pf_awards", fetched, cache.ttl_minutes * 60, cache.max_entries
+        )
+
+
+def fa_get_keys(apps):
+    """Build PowerFAIDS lookup keys for Active apps.
+
+    Returns:
+    dict like {aid: (pcid, govid, appid, year, term, session)}
     """
     global CURRENT_RECORD
-    global RM_MAPPING
-    sync_errors = False
+    fa_keys = {}
+
+    for k, v in apps.items():
+        CURRENT_RECORD = k
+        if v["status_calc"] == "Active":
+            app_pc = format_app_sql(v, RM_MAPPING, SETTINGS.powercampus)
+            fa_keys[k] = (
+                app_pc["PEOPLE_CODE_ID"],
+                v["GovernmentId"],
+                v["AppID"],
+                app_pc["ACADEMIC_YEAR"],
+                app_pc["ACADEMIC_TERM"],
+                app_pc["ACADEMIC_SESSION"],
+            )
+
+    return fa_keys
+
+
+def fa_collect(fa_keys, worker=False, refresh=False):
+    """Fetch PowerFAIDS awards and Financial Aid checklists for many apps using the set-based procedures.
+
+    Keyword arguments:
+    fa_keys -- dict from fa_get_keys()
+    worker -- True if running on a worker thread, which has its own SQL connection to release when finished
+    refresh -- bypass the awards cache
+
+    Returns:
+    awards -- dict like {aid: (fa_awards, fa_status)}
+    checklist -- list of checklist items for slate_post_fa_checklist()
+    """
+    awards = {}
+    checklist = []
+
+    try:
+        if SETTINGS.fa_awards.enabled:
+            award_keys = {
+                aid: (k[0], k[1], k[3], k[4], k[5]) for (aid, k) in fa_keys.items()
+            }
+            results = fa_get_awards(list(set(award_keys.values())), refresh)
+            awards = {aid: results[k] for (aid, k) in award_keys.items()}
+
+        if CONFIG["fa_checklist"]["enabled"] == True:
+            checklist = ps_powercampus.pf_get_fachecklist_batch(list(fa_keys.values()))
+    finally:
+        if worker:
+            ps_powercampus.release_connection()
+
+    return awards, checklist
+
 
+def post_groups(apps, keys):
+    """Split apps to be posted to the PowerCampus API into groups. Returns a list of (keys, duplicates) tuples.
+
+    duplicates is None if post_api() should check each app for a duplicate person itself. With batch_duplicate_check,
+    every government ID is checked up front, then apps for new people are posted before apps for existing people.
+    Empty groups are left out.
+    """
+    if not SETTINGS.powercampus.batch_duplicate_check or len(keys) == 0:
+        return [(keys, None)]
+
+    existing = ps_powercampus.find_duplicates([apps[k]["GovernmentId"] for k in keys])
+    new = []
+    duplicate = []
+    for k in keys:
+        govid = apps[k]["GovernmentId"]
+        if govid in existing:
+            duplicate.append(k)
+        else:
+            new.append(k)
+            # A second app for the same new person must wait until the first has created them
+            if govid:
+                existing.add(govid)
+    verbose_print(
+        "\t" + str(len(duplicate)) + " of " + str(len(keys)) + " are existing people"
+    )
+    return [(g, d) for (g, d) in [(new, False), (duplicate, True)] if len(g) > 0]
+
+
+def update_notes_udfs_stops(app_pc, pcid, batch=None):
+    """Update the PowerCampus Notes, User Defined fields, and Stops for an app.
+
+    Keyword arguments:
+    app_pc -- application dict formatted for PowerCampus
+    pcid -- PEOPLE_CODE_ID
+    batch -- optional ps_powercampus.UpdateBatch to queue the calls in
+    """
+    # Update any PowerCampus Notes defined in config
+    for note in SETTINGS.powercampus.notes:
+        if note["slate_field"] in app_pc and len(app_pc[note["slate_field"]]) > 0:
+            ps_powercampus.update_note(
+                app_pc,
+                note["slate_field"],
+                note["office"],
+                note["note_type"],
+                batch,
+            )
+
+    # Update any PowerCampus User Defined fields defined in config
+    for udf in SETTINGS.powercampus.user_defined_fields:
+        if udf["slate_field"] in app_pc and len(app_pc[udf["slate_field"]]) > 0:
+            ps_powercampus.update_udf(
+                app_pc, udf["slate_field"], udf["pc_field"], batch
+            )
+
+    # Update PowerCampus Stops
+    if "Stops" in app_pc:
+        for stop in app_pc["Stops"]:
+            stop = Stop_from_Slate(stop)
+            ps_powercampus.update_stop(pcid, stop, batch)
+
+
+@ps_metrics.instrumented("sync")
+def main_sync(pid=None):
+    """Main body of the program.
+
+    Keyword arguments:
+    pid -- specific person GUID to sync, or a list of person GUID's (default None)
+    """
+    ps_metrics.stage("fetch")
     verbose_print("Get applicants from Slate...")
     creds = (
         CONFIG["slate_query_apps"]["username"],
         CONFIG["slate_query_apps"]["password"],
     )
-    if pid is not None:
-        r = requests.get(
-            CONFIG["slate_query_apps"]["url"], auth=creds, params={"pid": pid}
-        )
+    if isinstance(pid, (list, tuple)):
+        # The Slate query must accept comma-separated values for pid.
+        # Batches of 48 to avoid exceeding max GET request, like slate_get_actions().
+        pids = list(dict.fromkeys(pid))
+        apps = []
+        for i in range(0, len(pids), 48):
+            r = http_session().get(
+                CONFIG["slate_query_apps"]["url"],
+                auth=creds,
+                params={"pid": ",".join(pids[i : i + 48])},
+            )
+            r.raise_for_status()
+            apps.extend(json.loads(r.text)["row"])
     else:
-        r = requests.get(CONFIG["slate_query_apps"]["url"], auth=creds)
-    r.raise_for_status()
-    apps = json.loads(r.text)["row"]
+        if pid is not None:
+            r = http_session().get(
+                CONFIG["slate_query_apps"]["url"], auth=creds, params={"pid": pid}
+            )
+        else:
+            r = http_session().get(CONFIG["slate_query_apps"]["url"], auth=creds)
+        r.raise_for_status()
+        apps = json.loads(r.text)["row"]
     verbose_print("\tFetched " + str(len(apps)) + " apps")
+    ps_metrics.items(len(apps))
+    if SETTINGS.snapshot.record:
+        ps_snapshot.start(pid, CONFIG["slate_query_apps"]["url"])
+        ps_snapshot.record("app", apps)
 
     # Make a dict of apps with application GUID as the key
     # {AppGUID: { JSON from Slate }
@@ -309,12 +767,59 @@ def main_sync(pid=None):
         # Don't raise an error for scheduled mode
         return None
 
+    if not SETTINGS.coordination.enabled:
+        return sync_apps(apps, pid)
+
+    # Scheduled runs lease and sync apps a chunk at a time, so on-demand syncs aren't blocked for the whole run
+    aids = list(apps)
+    chunk_size = len(aids)
+    if pid is None and SETTINGS.coordination.chunk_size:
+        chunk_size = SETTINGS.coordination.chunk_size
+    output_msg = None
+    busy = []
+    for i in range(0, len(aids), chunk_size):
+        ps_metrics.stage("claim")
+        verbose_print("Claim apps in local state database")
+        claimed, sync_hashes, chunk_busy = claim_apps(
+            {k: apps[k] for k in aids[i : i + chunk_size]}, pid
+        )
+        busy.extend(chunk_busy)
+        if len(claimed) > 0:
+            output_msg = sync_apps(claimed, pid, sync_hashes)
+
+    if pid is not None and len(busy) > 0:
+        if output_msg is None:
+            raise SyncBusy(SETTINGS.msg_strings.error_sync_busy)
+        output_msg = SETTINGS.msg_strings.sync_done_partial
+        verbose_print(output_msg)
+
+    return output_msg
+
+
+def sync_apps(apps, pid=None, sync_hashes=None):
+    """Sync a dict of apps fetched from Slate with PowerCampus, then upload results back to Slate.
+
+    Keyword arguments:
+    apps -- dict of {aid: app} from Slate
+    pid -- the person GUID or GUID's main_sync() was called with
+    sync_hashes -- dict of {aid: payload hash} for apps leased by claim_apps(), if coordination is enabled
+
+    Returns:
+    output_msg -- text for the user
+    """
+    global CURRENT_RECORD
+    global RM_MAPPING
+    global RM_MAPPING_MTIME
+    sync_errors = False
+
+    ps_metrics.stage("format", len(apps))
     verbose_print("Clean up app data from Slate (datatypes, supply nulls, etc.)")
     for k, v in apps.items():
         CURRENT_RECORD = k
         apps[k] = format_app_generic(v, CONFIG["slate_upload_active"])
 
     if SETTINGS.powercampus.autoconfigure_mappings.enabled:
+        ps_metrics.stage("autoconfigure")
         verbose_print("Auto-configure ProgramOfStudy and recruiterMapping.xml")
         CURRENT_RECORD = None
         mfl = SETTINGS.powercampus.mapping_file_location
@@ -327,9 +832,12 @@ def main_sync(pid=None):
         ]
         yt_list = [apps[app]["YearTerm"] for app in apps if "YearTerm" in apps[app]]
 
-        if ps_powercampus.autoconfigure_mappings(dp_list, yt_list, vd, mdy, mfl):
-            RM_MAPPING = ps_powercampus.get_recruiter_mapping(mfl)
+        with CONFIG_LOCK:
+            if ps_powercampus.autoconfigure_mappings(dp_list, yt_list, vd, mdy, mfl):
+                RM_MAPPING = ps_powercampus.get_recruiter_mapping(mfl)
+                RM_MAPPING_MTIME = os.path.getmtime(mfl)
 
+    ps_metrics.stage("scan", len(apps))
     verbose_print("Check each app's status flags/PCID in PowerCampus")
     for k, v in apps.items():
         CURRENT_RECORD = k
@@ -343,21 +851,70 @@ def main_sync(pid=None):
         )
         apps[k]["PEOPLE_CODE_ID"] = pcid
 
+    ps_metrics.stage("post")
     verbose_print("Post new or repost unprocessed applications to PowerCampus API")
-    for k, v in apps.items():
-        CURRENT_RECORD = k
-        if (v["status_ra"] == None) or (
-            v["status_ra"] in (1, 2) and v["status_app"] is None
-        ):
-            pcid = ps_powercampus.post_api(
-                format_app_api(v, CONFIG["defaults"]),
-                MSG_STRINGS,
-                SETTINGS.powercampus.app_form_setting_id,
-            )
-            apps[k]["PEOPLE_CODE_ID"] = pcid
-
-            # Rescan status
-            status_ra, status_app, status_calc, pcid = ps_powercampus.scan_status(v)
+    post_keys = [
+        k
+        for (k, v) in apps.items()
+        if (v["status_ra"] == None)
+        or (v["status_ra"] in (1, 2) and v["status_app"] is None)
+    ]
+    ps_metrics.items(len(post_keys))
+    rescan = SETTINGS.powercampus.deferred_rescan
+    if SETTINGS.powercampus.batch_duplicate_check:
+        # Hold the post lock from the up-front duplicate check until every post, so another sync
+        # in this process can't create one of these people in between
+        post_lock = ps_powercampus.POST_LOCK
+    else:
+        post_lock = contextlib.nullcontext()
+
+    with post_lock:
+        for keys, duplicates in post_groups(apps, post_keys):
+            if duplicates:
+                # Toggle auto-process off once around every app for an existing person
+                post_context = ps_powercampus.autoprocess_disabled(
+                    SETTINGS.powercampus.app_form_setting_id
+                )
+            else:
+                post_context = contextlib.nullcontext()
+
+            with post_context:
+                for k in keys:
+                    CURRENT_RECORD = k
+                    v = apps[k]
+                    pcid = ps_powercampus.post_api(
+                        format_app_api(v, CONFIG["defaults"]),
+                        MSG_STRINGS,
+                        SETTINGS.powercampus.app_form_setting_id,
+                        duplicates is None,
+                    )
+                    apps[k]["PEOPLE_CODE_ID"] = pcid
+
+                    # Rescan status, unless deferred until every app is posted
+                    if not rescan.enabled:
+                        status_ra, status_app, status_calc, pcid = (
+                            ps_powercampus.scan_status(v)
+                        )
+                        apps[k].update(
+                            {
+                                "status_ra": status_ra,
+                                "status_app": status_app,
+                                "status_calc": status_calc,
+                            }
+                        )
+                        apps[k]["PEOPLE_CODE_ID"] = pcid
+
+    if rescan.enabled and len(post_keys) > 0:
+        # Rescan every posted app at once, waiting for the API to finish processing them
+        statuses = ps_powercampus.scan_status_batch(
+            [apps[k] for k in post_keys],
+            rescan.max_wait_seconds,
+            rescan.poll_seconds,
+            rescan.backoff,
+        )
+        for k in post_keys:
+            CURRENT_RECORD = k
+            status_ra, status_app, status_calc, pcid = statuses[k]
             apps[k].update(
                 {
                     "status_ra": status_ra,
@@ -367,6 +924,7 @@ def main_sync(pid=None):
             )
             apps[k]["PEOPLE_CODE_ID"] = pcid
 
+    ps_metrics.stage("actions")
     verbose_print("Get scheduled actions from Slate")
     if CONFIG["scheduled_actions"]["enabled"] == True:
         CURRENT_RECORD = None
@@ -374,28 +932,64 @@ def main_sync(pid=None):
         actions_list = slate_get_actions(
             [k for (k, v) in apps.items() if v["status_calc"] == "Active"]
         )
+        if SETTINGS.snapshot.record:
+            ps_snapshot.record("action", actions_list)
 
         if CONFIG["scheduled_actions"]["autolearn_action_codes"] == True:
             learn_actions(actions_list)
 
+    # Set-based PowerFAIDS lookups, optionally on a separate thread while PowerCampus is updated
+    fa_batch = SETTINGS.fa_processing.batch and (
+        SETTINGS.fa_awards.enabled or CONFIG["fa_checklist"]["enabled"] == True
+    )
+    fa_future = None
+    # On-demand syncs of a single person can skip the awards cache so staff see current data
+    fa_refresh = SETTINGS.fa_awards.cache.force_refresh or (
+        pid is not None and SETTINGS.fa_awards.cache.bypass_on_demand
+    )
+    if fa_batch:
+        fa_keys = fa_get_keys(apps)
+        if SETTINGS.fa_processing.concurrent:
+            verbose_print("Start collecting PowerFAIDS data in the background")
+            fa_executor = ThreadPoolExecutor(max_workers=1)
+            fa_future = fa_executor.submit(fa_collect, fa_keys, True, fa_refresh)
+            fa_executor.shutdown(wait=False)
+
+    ps_metrics.stage("update")
     verbose_print("Update existing applications in PowerCampus and extract information")
     edu_sync_results = []
+    fa_pending = {}
     for k, v in apps.items():
         CURRENT_RECORD = k
         if v["status_calc"] == "Active":
+            ps_metrics.items(1)
+            ps_metrics.lap("other")
             # Transform to PowerCampus format
             app_pc = format_app_sql(v, RM_MAPPING, SETTINGS.powercampus)
+            ps_metrics.lap("format_sql")
             pcid = app_pc["PEOPLE_CODE_ID"]
             academic_year = app_pc["ACADEMIC_YEAR"]
             academic_term = app_pc["ACADEMIC_TERM"]
             academic_session = app_pc["ACADEMIC_SESSION"]
 
             # Single-row updates
+            # In batch mode, these are queued and sent to PowerCampus in one round trip.
+            if SETTINGS.powercampus.batch_updates:
+                batch = ps_powercampus.UpdateBatch()
+            else:
+                batch = None
+
             if SETTINGS.powercampus.update_academic_key:
-                ps_powercampus.update_academic_key(app_pc)
-            ps_powercampus.update_demographics(app_pc)
-            ps_powercampus.update_academic(app_pc)
-            ps_powercampus.update_smsoptin(app_pc)
+                ps_powercampus.update_academic_key(app_pc, batch)
+            ps_powercampus.update_demographics(app_pc, batch)
+            ps_powercampus.update_academic(app_pc, batch)
+            ps_powercampus.update_smsoptin(app_pc, batch)
+
+            if batch is not None:
+                # Notes, UDFs, and stops share the batch, so they are written before scheduled actions and education
+                update_notes_udfs_stops(app_pc, pcid, batch)
+                batch.execute()
+            ps_metrics.lap("single_row_updates")
 
             # Update PowerCampus Scheduled Actions
             if CONFIG["scheduled_actions"]["enabled"] == True:
@@ -416,6 +1010,7 @@ def main_sync(pid=None):
                     academic_term,
                     academic_session,
                 )
+                ps_metrics.lap("scheduled_actions")
 
             # Update PowerCampus Education records
             if "Education" in app_pc:
@@ -430,29 +1025,11 @@ def main_sync(pid=None):
             if "TestScoresNumeric" in app_pc:
                 for test in app_pc["TestScoresNumeric"]:
                     ps_powercampus.update_test_scores(pcid, test)
+            ps_metrics.lap("education_tests")
 
-            # Update any PowerCampus Notes defined in config
-            for note in SETTINGS.powercampus.notes:
-                if (
-                    note["slate_field"] in app_pc
-                    and len(app_pc[note["slate_field"]]) > 0
-                ):
-                    ps_powercampus.update_note(
-                        app_pc, note["slate_field"], note["office"], note["note_type"]
-                    )
-
-            # Update any PowerCampus User Defined fields defined in config
-            for udf in SETTINGS.powercampus.user_defined_fields:
-                if udf["slate_field"] in app_pc and len(app_pc[udf["slate_field"]]) > 0:
-                    ps_powercampus.update_udf(
-                        app_pc, udf["slate_field"], udf["pc_field"]
-                    )
-
-            # Update PowerCampus Stops
-            if "Stops" in app_pc:
-                for stop in app_pc["Stops"]:
-                    stop = Stop_from_Slate(stop)
-                    ps_powercampus.update_stop(pcid, stop)
+            if batch is None:
+                update_notes_udfs_stops(app_pc, pcid)
+                ps_metrics.lap("notes_udfs_stops")
 
             # Collect information
             (
@@ -495,23 +1072,45 @@ def main_sync(pid=None):
             )
             if error_flag == True:
                 sync_errors == True
+            ps_metrics.lap("profile")
 
             # Get PowerFAIDS awards and tracking status
-            if SETTINGS.fa_awards.enabled:
-                fa_awards, fa_status = ps_powercampus.pf_get_awards(
+            if SETTINGS.fa_awards.enabled and not fa_batch:
+                fa_key = (
                     pcid,
                     v["GovernmentId"],
                     academic_year,
                     academic_term,
                     academic_session,
                 )
+                fa_results = fa_get_awards([fa_key], fa_refresh, fa_pending)
+                fa_awards, fa_status = fa_results[fa_key]
                 apps[k].update({"fa_awards": fa_awards, "fa_status": fa_status})
+                ps_metrics.lap("fa_awards")
+
+    # Store the awards fetched one app at a time in the cache with one write
+    fa_cache_put(fa_pending)
 
+    if fa_batch:
+        ps_metrics.stage("fa_batch")
+        if fa_future is not None:
+            verbose_print("Wait for PowerFAIDS data")
+            fa_awards, fa_checklist = fa_future.result()
+        else:
+            verbose_print("Collect PowerFAIDS awards and Financial Aid checklist")
+            fa_awards, fa_checklist = fa_collect(fa_keys, refresh=fa_refresh)
+
+        for k, (awards, status) in fa_awards.items():
+            apps[k].update({"fa_awards": awards, "fa_status": status})
+
+    ps_metrics.stage("uploads")
     verbose_print("Upload passive fields back to Slate")
-    slate_post_fields(apps, CONFIG["slate_upload_passive"])
+    verbose_print(slate_post_fields(apps, CONFIG["slate_upload_passive"]))
+    ps_metrics.lap("passive_fields")
 
     verbose_print("Upload active (changed) fields back to Slate")
     verbose_print(slate_post_apps_changed(apps, CONFIG["slate_upload_active"]))
+    ps_metrics.lap("active_fields")
 
     if len(edu_sync_results) > 0 and edu_sync_results[0] is not None:
         verbose_print("Upload education records sync status back to Slate")
@@ -520,9 +1119,14 @@ def main_sync(pid=None):
                 edu_sync_results, CONFIG["slate_upload_schools"]
             )
         )
+        ps_metrics.lap("education")
 
     # Collect Financial Aid checklist and upload to Slate
-    if CONFIG["fa_checklist"]["enabled"] == True:
+    ps_metrics.stage("fa_checklist")
+    if CONFIG["fa_checklist"]["enabled"] == True and fa_batch:
+        verbose_print("Upload Financial Aid checklist to Slate")
+        slate_post_fa_checklist(fa_checklist)
+    elif CONFIG["fa_checklist"]["enabled"] == True:
         verbose_print("Collect Financial Aid checklist and upload to Slate")
         slate_upload_list = []
         # slate_upload_fields = {'AppID', 'Code', 'Status', 'Date'}
@@ -546,6 +1150,19 @@ def main_sync(pid=None):
 
         slate_post_fa_checklist(slate_upload_list)
 
+    if sync_hashes is not None:
+        # Apps that aren't fully processed yet are retried on the next run regardless of their hash
+        ps_state.finish_syncs(
+            {
+                k: v
+                for (k, v) in sync_hashes.items()
+                if apps[k]["status_calc"] == "Active"
+                and apps[k].get("error_flag") != True
+            },
+            sync_owner(),
+        )
+        ps_state.release_syncs(sync_owner(), list(sync_hashes))
+
     # Warn if any apps returned an error flag from ps_powercampus.get_profile()
     if sync_errors == True:
         output_msg = MSG_STRINGS["sync_done_not_found"]
@@ -0,0 +1,330 @@
+import datetime
+import functools
+import json
+import re
+import threading
+import time
+import traceback
+
+# Per-stage timing for sync runs. Each thread tracks its own run, so concurrent syncs don't mix their numbers.
+REPORT_PATH = None
+RUNS = threading.local()
+WRITE_LOCK = threading.Lock()
+
+# Round trips by kind since the process started, for the sync server's /metrics endpoint
+TOTALS = {}
+TOTALS_LOCK = threading.Lock()
+
+# SQL call tracing. Totals since the process started are kept alongside each run's own totals.
+SQL_TRACE = False
+SLOW_SQL_MS = None
+SQL_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+SQL_STATS = {}
+SQL_LOCK = threading.Lock()
+SQL_LAST = threading.local()
+PROCEDURE_PATTERN = re.compile(r"^\s*exec(?:ute)?\s+([\w\[\]\.]+)", re.IGNORECASE)
+
+# Called with each stage name as it starts, and with None when a run finishes. Set by ps_profile.
+STAGE_HOOK = None
+
+
+def init(report_path=None, sql_trace=False, slow_sql_ms=None):
+    """Configure run reports and SQL tracing.
+
+    Keyword arguments:
+    report_path -- JSON lines file that run reports are appended to, or None to keep them in memory only
+    sql_trace -- record per-procedure call counts, latency histograms, and row counts
+    slow_sql_ms -- log SQL calls slower than this many milliseconds, or None
+    """
+    global REPORT_PATH
+    global SQL_TRACE
+    global SLOW_SQL_MS
+
+    REPORT_PATH = report_path
+    SQL_TRACE = sql_trace
+    SLOW_SQL_MS = slow_sql_ms
+
+
+def current_run():
+    return getattr(RUNS, "run", None)
+
+
+def last_run():
+    """Return the calling thread's most recently finished run, or None."""
+    return getattr(RUNS, "last", None)
+
+
+def start_run(kind, pid=None):
+    """Begin tracking a run on the calling thread."""
+    RUNS.run = {
+        "kind": kind,
+        "pid": pid,
+        "started": datetime.datetime.now().isoformat(),
+        "status": None,
+        "seconds": None,
+        "stages": {},
+        "sql": {},
+        "slow_sql": [],
+    }
+    RUNS.clock = time.perf_counter()
+    RUNS.stage = None
+    RUNS.lap = None
+    RUNS.lap_calls = {}
+
+
+def end_stage():
+    """Close the current stage, adding its wall time since it started."""
+    run = current_run()
+    stage = getattr(RUNS, "stage", None)
+    if run is None or stage is None:
+        return
+    run["stages"][stage]["seconds"] += time.perf_counter() - RUNS.stage_start
+    RUNS.stage = None
+
+
+def stage(name, items=None):
+    """Start a named stage, ending the previous one. Stages started more than once accumulate."""
+    run = current_run()
+    if run is None:
+        return
+    end_stage()
+    s = run["stages"].setdefault(
+        name, {"seconds": 0.0, "items": None, "calls": {}, "operations": {}}
+    )
+    if items is not None:
+        s["items"] = (s["items"] or 0) + items
+    if STAGE_HOOK is not None:
+        STAGE_HOOK(name)
+    RUNS.stage = name
+    RUNS.stage_start = time.perf_counter()
+    RUNS.lap = RUNS.stage_start
+    RUNS.lap_calls = dict(s["calls"])
+
+
+def items(n):
+    """Add to the item count of the current stage."""
+    run = current_run()
+    if run is None or RUNS.stage is None:
+        return
+    s = run["stages"][RUNS.stage]
+    s["items"] = (s["items"] or 0) + n
+
+
+def lap(name):
+    """Attribute the time and round trips since the stage started or the previous lap to a sub-operation of the current stage."""
+    run = current_run()
+    if run is None or RUNS.stage is None:
+        return
+    now = time.perf_counter()
+    s = run["stages"][RUNS.stage]
+    op = s["operations"].setdefault(name, {"seconds": 0.0, "count": 0, "calls": {}})
+    op["seconds"] += now - RUNS.lap
+    op["count"] += 1
+    for kind, n in s["calls"].items():
+        n -= RUNS.lap_calls.get(kind, 0)
+        if n > 0:
+            op["calls"][kind] = op["calls"].get(kind, 0) + n
+    RUNS.lap = now
+    RUNS.lap_calls = dict(s["calls"])
+
+
+def count(kind, n=1):
+    """Count round trips (SQL calls, HTTP requests) against the current stage and the process totals."""
+    with TOTALS_LOCK:
+        TOTALS[kind] = TOTALS.get(kind, 0) + n
+    run = current_run()
+    if run is None or RUNS.stage is None:
+        return
+    calls = run["stages"][RUNS.stage]["calls"]
+    calls[kind] = calls.get(kind, 0) + n
+
+
+def totals():
+    """Return a copy of round trip counts by kind since the process started."""
+    with TOTALS_LOCK:
+        return dict(TOTALS)
+
+
+def count_response(response, *args, **kwargs):
+    """requests response hook that counts HTTP round trips by host."""
+    count("http " + response.url.split("/")[2])
+
+
+def finish_run(status, error=None):
+    """Close the calling thread's run, append it to the report file if one is set, and return it."""
+    run = current_run()
+    if run is None:
+        return None
+    end_stage()
+    if STAGE_HOOK is not None:
+        STAGE_HOOK(None)
+    run["status"] = status
+    run["seconds"] = time.perf_counter() - RUNS.clock
+    if error is not None:
+        run["error"] = error
+    RUNS.run = None
+    RUNS.last = run
+
+    if REPORT_PATH is not None:
+        with WRITE_LOCK:
+            with open(REPORT_PATH, "a") as file:
+                file.write(json.dumps(run, default=str) + "\n")
+    return run
+
+
+def instrumented(kind):
+    """Decorator that tracks each call of a function as a run, recording failures before re-raising."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start_run(kind, kwargs.get("pid", args[0] if len(args) > 0 else None))
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                finish_run("error", traceback.format_exc())
+                raise
+            finish_run("ok")
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def summary(run=None):
+    """Return a plain-text table of a run's stages, for console output and notification emails."""
+    if run is None:
+        run = last_run()
+    if run is None:
+        return "No run report."
+
+    lines = [
+        "Run started "
+        + run["started"]
+        + ", "
+        + str(run["status"])
+        + " after "
+        + format(run["seconds"], ".1f")
+        + "s"
+    ]
+    for name, s in run["stages"].items():
+        line = "  " + name.ljust(14) + format(s["seconds"], "9.2f") + "s"
+        if s["items"] is not None:
+            line += "  " + str(s["items"]) + " items"
+        if len(s["calls"]) > 0:
+            line += "  " + ", ".join(k + ": " + str(v) for (k, v) in s["calls"].items())
+        lines.append(line)
+        for op, o in s["operations"].items():
+            line = (
+                "    "
+                + op.ljust(20)
+                + format(o["seconds"], "9.2f")
+                + "s  x"
+                + str(o["count"])
+            )
+            if len(o["calls"]) > 0:
+                line += "  " + ", ".join(
+                    k + ": " + str(v) for (k, v) in o["calls"].items()
+                )
+            lines.append(line)
+    if len(run["sql"]) > 0:
+        lines.append("  SQL by total time:")
+        for name, s in sorted(
+            run["sql"].items(), key=lambda item: item[1]["seconds"], reverse=True
+        )[:10]:
+            lines.append(
+                "    "
+                + name.ljust(40)
+                + format(s["seconds"], "9.2f")
+                + "s  x"
+                + str(s["calls"])
+                + "  max "
+                + format(s["max_ms"], ".0f")
+                + " ms  "
+                + str(s["rows"])
+                + " rows"
+            )
+    return "\n".join(lines)
+
+
+def sql_name(sql):
+    """Return the procedure name of an EXEC statement, 'batch' for several statements, or the first line otherwise."""
+    match = PROCEDURE_PATTERN.match(sql)
+    if match is None:
+        return sql.strip().split("\n")[0][:40]
+    if len(re.findall(r"\bexec(?:ute)?\s", sql, re.IGNORECASE)) > 1:
+        return "batch"
+    return match.group(1).replace("[", "").replace("]", "")
+
+
+def new_sql_stats():
+    return {
+        "calls": 0,
+        "seconds": 0.0,
+        "max_ms": 0.0,
+        "rows": 0,
+        "histogram": [0] * (len(SQL_BUCKETS_MS) + 1),
+    }
+
+
+def add_sql_stats(stats, name, seconds, calls, rows):
+    s = stats.get(name)
+    if s is None:
+        s = stats[name] = new_sql_stats()
+    s["calls"] += calls
+    s["seconds"] += seconds
+    s["rows"] += rows
+    if calls > 0:
+        ms = seconds * 1000
+        s["max_ms"] = max(s["max_ms"], ms)
+        i = 0
+        while i < len(SQL_BUCKETS_MS) and ms > SQL_BUCKETS_MS[i]:
+            i += 1
+        s["histogram"][i] += 1
+
+
+def record_sql(name, seconds, calls=1, rows=0):
+    """Add a SQL call, or the rows fetched after it, to the process totals and the current run."""
+    with SQL_LOCK:
+        add_sql_stats(SQL_STATS, name, seconds, calls, rows)
+    run = current_run()
+    if run is not None:
+        add_sql_stats(run["sql"], name, seconds, calls, rows)
+
+
+def sql_executed(name, seconds):
+    """Record a cursor execute() and remember it so later fetches are attributed to the same procedure."""
+    count("sql")
+    if not SQL_TRACE:
+        return
+    SQL_LAST.name = name
+    record_sql(name, seconds)
+    if SLOW_SQL_MS is not None and seconds * 1000 >= SLOW_SQL_MS:
+        ms = round(seconds * 1000, 1)
+        print("Slow SQL call: " + name + " took " + str(ms) + " ms")
+        run = current_run()
+        if run is not None and len(run["slow_sql"]) < 100:
+            run["slow_sql"].append({"procedure": name, "ms": ms})
+
+
+def sql_fetched(rows, seconds):
+    """Record rows fetched and fetch time against the calling thread's last procedure."""
+    if not SQL_TRACE:
+        return
+    name = getattr(SQL_LAST, "name", None)
+    if name is not None:
+        record_sql(name, seconds, 0, rows)
+
+
+def sql_stats():
+    """Return SQL totals since the process started, with histogram buckets labelled by upper bound in ms."""
+    labels = [str(b) for b in SQL_BUCKETS_MS] + ["+Inf"]
+    with SQL_LOCK:
+        return {
+            "buckets_ms": labels,
+            "procedures": {
+                name: dict(s, histogram=dict(zip(labels, s["histogram"])))
+                for (name, s) in sorted(SQL_STATS.items())
+            },
+        }
@@ -1,8 +1,117 @@
 import requests
+import contextlib
 import json
+import threading
+import time
 import pyodbc
 import xml.etree.ElementTree as ET
+import ps_metrics
 import ps_models
+import ps_state
+
+
+class ThreadConnections:
+    """Give each thread its own pyodbc connection and cursor.
+
+    Attribute access is passed through to the calling thread's connection, so module code can keep using
+    CNXN and CURSOR as if they were a single connection. Connections are opened on first use.
+    """
+
+    def __init__(self, connection_string):
+        self.connection_string = connection_string
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.open_connections = []
+
+    def get(self):
+        cnxn = getattr(self.local, "cnxn", None)
+        if cnxn is None:
+            cnxn = pyodbc.connect(self.connection_string)
+            self.local.cnxn = cnxn
+            self.local.cursor = cnxn.cursor()
+            with self.lock:
+                self.open_connections.append(cnxn)
+        return cnxn
+
+    def cursor(self):
+        self.get()
+        return self.local.cursor
+
+    def release(self):
+        """Close the calling thread's connection, if it has one."""
+        cnxn = getattr(self.local, "cnxn", None)
+        if cnxn is not None:
+            self.local.cnxn = None
+            self.local.cursor = None
+            with self.lock:
+                self.open_connections.remove(cnxn)
+            try:
+                cnxn.close()
+            except pyodbc.Error:
+                pass
+
+    def close(self):
+        """Close every thread's connection."""
+        with self.lock:
+            connections = self.open_connections
+            self.open_connections = []
+        for cnxn in connections:
+            try:
+                cnxn.close()
+            except pyodbc.Error:
+                pass
+        self.local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+class ThreadCursor:
+    """Pass attribute access through to the calling thread's cursor."""
+
+    def __init__(self, connections):
+        self.connections = connections
+
+    def execute(self, sql, *params):
+        start = time.perf_counter()
+        try:
+            return self.connections.cursor().execute(sql, *params)
+        finally:
+            ps_metrics.sql_executed(
+                ps_metrics.sql_name(sql), time.perf_counter() - start
+            )
+
+    def executemany(self, sql, seq_of_params):
+        start = time.perf_counter()
+        try:
+            return self.connections.cursor().executemany(sql, seq_of_params)
+        finally:
+            ps_metrics.sql_executed(
+                ps_metrics.sql_name(sql), time.perf_counter() - start
+            )
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self.connections.cursor().fetchone()
+        ps_metrics.sql_fetched(0 if row is None else 1, time.perf_counter() - start)
+        return row
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = self.connections.cursor().fetchall()
+        ps_metrics.sql_fetched(len(rows), time.perf_counter() - start)
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self.connections.cursor(), name)
+
+
+# Reentrant so a group of posts can hold it while auto-process is toggled off around all of them
+POST_LOCK = threading.RLock()
+API_SESSIONS = threading.local()
+# One connection shared by health checks, so probing doesn't open a connection per HTTP handler thread
+PROBE_LOCK = threading.Lock()
+PROBE_CNXN = None
 
 
 def init(config, verbose, msg_strings):
@@ -22,12 +131,12 @@ def init(config, verbose, msg_strings):
     PC_API_URL = config.api.url
     PC_API_CRED = (config.api.username, config.api.password)
 
-    # Microsoft SQL Server connection.
-    CNXN = pyodbc.connect(config.database_string)
-    CURSOR = CNXN.cursor()
+    # Microsoft SQL Server connection. Each thread gets its own.
+    CNXN = ThreadConnections(config.database_string)
+    CURSOR = ThreadCursor(CNXN)
 
     # Print a test of connections
-    r = requests.get(PC_API_URL + "api/version", auth=PC_API_CRED)
+    r = api_session().get(PC_API_URL + "api/version", auth=PC_API_CRED)
     verbose_print("PowerCampus API Status: " + str(r.status_code))
     verbose_print(r.text)
     r.raise_for_status()
@@ -41,6 +150,91 @@ def de_init():
     # Clean up connections.
     if CNXN:
         CNXN.close()  # SQL
+    with PROBE_LOCK:
+        close_probe()
+
+
+def release_connection():
+    """Close the calling thread's SQL connection. Worker threads should call this when finished."""
+    CNXN.release()
+
+
+def api_session():
+    """Return the calling thread's HTTP session for the PowerCampus Web API."""
+    session = getattr(API_SESSIONS, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.hooks["response"].append(ps_metrics.count_response)
+        API_SESSIONS.session = session
+    return session
+
+
+def check_connection():
+    """Return True if the calling thread's SQL connection is usable."""
+    try:
+        CURSOR.execute("SELECT 1")
+        CURSOR.fetchone()
+        return True
+    except pyodbc.Error:
+        return False
+
+
+def probe_database():
+    """Return True if SQL Server is reachable, for health checks.
+
+    Runs on a dedicated connection rather than the calling thread's. A connection that fails is closed and the
+    check is retried once on a fresh connection, so the probe recovers when the server comes back.
+    """
+    global PROBE_CNXN
+
+    with PROBE_LOCK:
+        for attempt in range(2):
+            try:
+                if PROBE_CNXN is None:
+                    PROBE_CNXN = pyodbc.connect(CONFIG.database_string)
+                cursor = PROBE_CNXN.cursor()
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+                cursor.close()
+                return True
+            except pyodbc.Error:
+                close_probe()
+    return False
+
+
+def close_probe():
+    global PROBE_CNXN
+
+    if PROBE_CNXN is not None:
+        try:
+            PROBE_CNXN.close()
+        except pyodbc.Error:
+            pass
+        PROBE_CNXN = None
+
+
+def recover():
+    """Reset the calling thread's SQL connection and Web API session after an error.
+
+    Open transactions are rolled back, and the connection is replaced only if it fails a health check.
+    """
+    try:
+        CNXN.rollback()
+    except pyodbc.Error:
+        pass
+
+    if not check_connection():
+        verbose_print("SQL connection failed health check. Reconnecting.")
+        release_connection()
+
+    session = getattr(API_SESSIONS, "session", None)
+    if session is not None:
+        API_SESSIONS.session = None
+        session.close()
+
+    # An error in post_api() may have left ProcessAutomatically toggled off.
+    with POST_LOCK:
+        update_app_form_autoprocess(CONFIG.app_form_setting_id, True)
 
 
 def verbose_print(x):
@@ -255,25 +449,51 @@ def get_recruiter_mapping(mapping_file_location):
     return rm_mapping
 
 
-def post_api(x, cfg_strings, app_form_setting_id):
+def post_api(x, cfg_strings, app_form_setting_id, check_duplicate=True):
     """Post an application to PowerCampus.
     Return  PEOPLE_CODE_ID if application was automatically accepted or None for all other conditions.
 
     Keyword arguments:
     x -- an application dict
+    check_duplicate -- check for a duplicate person and toggle auto-process around the post. Pass False if the caller
+        has already done so, like with find_duplicates() and autoprocess_disabled().
     """
 
-    # Check for duplicate person. If found, temporarily toggle auto-process off.
-    dup_found = False
-    CURSOR.execute("EXEC [custom].[PS_selPersonDuplicate] ?", x["GovernmentId"])
-    row = CURSOR.fetchone()
-    dup_found = row.DuplicateFound
-    if dup_found:
-        update_app_form_autoprocess(app_form_setting_id, False)
+    # ApplicationFormSetting is shared, so only one thread may post (and possibly toggle auto-process) at a time.
+    with POST_LOCK:
+        # Check for duplicate person. If found, temporarily toggle auto-process off.
+        dup_found = False
+        if check_duplicate:
+            CURSOR.execute("EXEC [custom].[PS_selPersonDuplicate] ?", x["GovernmentId"])
+            row = CURSOR.fetchone()
+            dup_found = row.DuplicateFound
+
+        if dup_found:
+            with autoprocess_disabled(app_form_setting_id):
+                r = post_api_request(x, cfg_strings)
+        else:
+            r = post_api_request(x, cfg_strings)
+
+        if r.text[-25:-12] == "New People Id":
+            try:
+                people_code = r.text[-11:-2]
+                # Error check. After slice because leading zeros need preserved.
+                int(people_code)
+                PEOPLE_CODE_ID = "P" + people_code
+                return PEOPLE_CODE_ID
+            except:
+                return None
+        else:
+            return None
 
+
+def post_api_request(x, cfg_strings):
+    """Send an application to the PowerCampus Web API and return the response."""
     # Expose error text response from API, replace useless error message(s).
     try:
-        r = requests.post(PC_API_URL + "api/applications", json=x, auth=PC_API_CRED)
+        r = api_session().post(
+            PC_API_URL + "api/applications", json=x, auth=PC_API_CRED
+        )
         r.raise_for_status()
         # The API returns 202 for mapping errors. Technically 202 is appropriate, but it should bubble up to the user.
         if r.status_code == 202:
@@ -282,9 +502,6 @@ def post_api(x, cfg_strings, app_form_setting_id):
         # Change newline handling so response text prints nicely in emails.
         rtext = r.text.replace("\r\n", "\n")
 
-        if dup_found:
-            update_app_form_autoprocess(app_form_setting_id, True)
-
         if (
             "BadRequest Object reference not set to an instance of an object." in rtext
             and "ApplicationsController.cs:line 183" in rtext
@@ -301,20 +518,39 @@ def post_api(x, cfg_strings, app_form_setting_id):
         else:
             raise requests.HTTPError(rtext)
 
-    if dup_found:
-        update_app_form_autoprocess(app_form_setting_id, True)
+    return r
+
 
-    if r.text[-25:-12] == "New People Id":
+@contextlib.contextmanager
+def autoprocess_disabled(app_form_setting_id):
+    """Hold the post lock with auto-process turned off, turning it back on even if posting fails.
+
+    Applications for people who already exist are posted this way so PowerCampus doesn't create a duplicate person.
+    """
+    with POST_LOCK:
+        update_app_form_autoprocess(app_form_setting_id, False)
         try:
-            people_code = r.text[-11:-2]
-            # Error check. After slice because leading zeros need preserved.
-            int(people_code)
-            PEOPLE_CODE_ID = "P" + people_code
-            return PEOPLE_CODE_ID
-        except:
-            return None
-    else:
-        return None
+            yield
+        finally:
+            update_app_form_autoprocess(app_form_setting_id, True)
+
+
+def find_duplicates(govids, chunk_size=500):
+    """Return the set of government ID's that already belong to a person, like PS_selPersonDuplicate for many ID's."""
+    govids = list(dict.fromkeys(g for g in govids if g))
+    duplicates = set()
+
+    for start in range(0, len(govids), chunk_size):
+        chunk = govids[start : start + chunk_size]
+        CURSOR.execute(
+            "EXEC [custom].[PS_selPersonDuplicateBatch] ?",
+            json.dumps([{"i": i, "govid": g} for i, g in enumerate(chunk)]),
+        )
+        for row in CURSOR.fetchall():
+            if row.DuplicateFound:
+                duplicates.add(chunk[row.KeyIndex])
+
+    return duplicates
 
 
 def scan_status(x):
@@ -342,47 +578,121 @@ def scan_status(x):
         ra_status = row.ra_status
         apl_status = row.apl_status
         pcid = row.PEOPLE_CODE_ID
-
-        # Determine status.
-        if row.ra_status in (0, 3, 4) and row.apl_status == 2 and pcid is not None:
-            computed_status = "Active"
-        elif row.ra_status in (0, 3, 4) and row.apl_status == 3 and pcid is None:
-            computed_status = "Declined"
-        elif row.ra_status in (0, 3, 4) and row.apl_status == 1 and pcid is None:
-            computed_status = "Pending"
-        elif row.ra_status == 1 and row.apl_status is None and pcid is None:
-            computed_status = "Required field missing."
-        elif row.ra_status == 2 and row.apl_status is None and pcid is None:
-            computed_status = "Required field mapping is missing."
-        else:
-            computed_status = "Unrecognized Status: " + str(row.ra_status)
+        computed_status = compute_status(row)
 
         if CONFIG.logging.enabled:
             # Write errors to external database for end-user presentation via SSRS.
-            CURSOR.execute(
-                "INSERT INTO"
-                + CONFIG.logging.log_table
-                + """
+            CURSOR.execute(status_log_sql(), status_log_params(x, row, computed_status))
+            CNXN.commit()
+
+    return ra_status, apl_status, computed_status, pcid
+
+
+def compute_status(row):
+    """Return a descriptive status from a row of [custom].[PS_selRAStatus]."""
+    pcid = row.PEOPLE_CODE_ID
+
+    if row.ra_status in (0, 3, 4) and row.apl_status == 2 and pcid is not None:
+        return "Active"
+    elif row.ra_status in (0, 3, 4) and row.apl_status == 3 and pcid is None:
+        return "Declined"
+    elif row.ra_status in (0, 3, 4) and row.apl_status == 1 and pcid is None:
+        return "Pending"
+    elif row.ra_status == 1 and row.apl_status is None and pcid is None:
+        return "Required field missing."
+    elif row.ra_status == 2 and row.apl_status is None and pcid is None:
+        return "Required field mapping is missing."
+    else:
+        return "Unrecognized Status: " + str(row.ra_status)
+
+
+def status_log_sql():
+    return "INSERT INTO" + CONFIG.logging.log_table + """
                 ([Ref],[ApplicationNumber],[ProspectId],[FirstName],[LastName],
                 [ComputedStatus],[Notes],[RecruiterApplicationStatus],[ApplicationStatus],[PEOPLE_CODE_ID])
             VALUES
-                (?,?,?,?,?,?,?,?,?,?)""",
-                [
-                    x["Ref"],
-                    x["aid"],
-                    x["pid"],
-                    x["FirstName"],
-                    x["LastName"],
-                    computed_status,
-                    row.ra_errormessage,
-                    row.ra_status,
-                    row.apl_status,
-                    pcid,
-                ],
+                (?,?,?,?,?,?,?,?,?,?)"""
+
+
+def status_log_params(x, row, computed_status):
+    return [
+        x["Ref"],
+        x["aid"],
+        x["pid"],
+        x["FirstName"],
+        x["LastName"],
+        computed_status,
+        row.ra_errormessage,
+        row.ra_status,
+        row.apl_status,
+        row.PEOPLE_CODE_ID,
+    ]
+
+
+def select_status_batch(apps, chunk_size=500):
+    """Return a dict of {aid: row of [custom].[PS_selRAStatusBatch]} for a list of application dicts that have been posted."""
+    rows = {}
+
+    for start in range(0, len(apps), chunk_size):
+        chunk = apps[start : start + chunk_size]
+        CURSOR.execute(
+            "EXEC [custom].[PS_selRAStatusBatch] ?",
+            json.dumps([{"i": i, "aid": x["aid"]} for i, x in enumerate(chunk)]),
+        )
+        for row in CURSOR.fetchall():
+            # Like scan_status(), keep the first row returned for each application
+            rows.setdefault(chunk[row.KeyIndex]["aid"], row)
+
+    return rows
+
+
+def scan_status_batch(apps, max_wait_seconds=0, poll_seconds=1, backoff=2):
+    """Query the PowerCampus status of many applications at once, like scan_status().
+
+    The Web API may still be processing applications that were just posted. Applications without a recognized
+    status are queried again after poll_seconds, multiplied by backoff each time, for up to max_wait_seconds.
+    Only the final status of each application is logged.
+
+    Returns:
+    dict of {aid: (ra_status, apl_status, computed_status, pcid)}
+    """
+    rows = select_status_batch(apps)
+    deadline = time.monotonic() + max_wait_seconds
+    delay = poll_seconds
+
+    while time.monotonic() + delay <= deadline:
+        unsettled = [
+            x
+            for x in apps
+            if x["aid"] not in rows
+            or compute_status(rows[x["aid"]]).startswith("Unrecognized Status")
+        ]
+        if len(unsettled) == 0:
+            break
+        time.sleep(delay)
+        delay *= backoff
+        rows.update(select_status_batch(unsettled))
+
+    results = {x["aid"]: (None, None, None, None) for x in apps}
+    log_params = []
+    for x in apps:
+        row = rows.get(x["aid"])
+        if row is not None:
+            computed_status = compute_status(row)
+            results[x["aid"]] = (
+                row.ra_status,
+                row.apl_status,
+                computed_status,
+                row.PEOPLE_CODE_ID,
             )
-            CNXN.commit()
+            log_params.append(status_log_params(x, row, computed_status))
 
-    return ra_status, apl_status, computed_status, pcid
+    if CONFIG.logging.enabled and len(log_params) > 0:
+        # Write errors to external database for end-user presentation via SSRS, with one commit.
+        CURSOR.executemany(status_log_sql(), log_params)
+        CNXN.commit()
+
+    return results
 
 
 def get_profile(app, campus_email_type):
@@ -482,81 +792,166 @@ def get_profile(app, campus_email_type):
     )
 
 
-def update_demographics(app):
-    CURSOR.execute(
+class UpdateBatch:
+    """Queue of single-row update procedure calls sent to SQL Server as one batch.
+
+    Each queued call keeps the semantics of its [custom] procedure; the batch only removes
+    the per-call round trip and commit. Statements run in the order they were added.
+    """
+
+    # SQL Server allows at most 2100 parameters per request.
+    max_params = 2000
+
+    def __init__(self):
+        self.statements = []
+        self.params = []
+        self.fingerprints = []
+
+    def __len__(self):
+        return len(self.statements)
+
+    def add(self, sql, params, fingerprint=None):
+        if len(self.params) + len(params) > self.max_params:
+            self.execute()
+        self.statements.append(sql)
+        self.params.extend(params)
+        if fingerprint is not None:
+            self.fingerprints.append(fingerprint)
+
+    def execute(self):
+        """Send all queued statements in one round trip and commit. Roll back everything if any statement fails."""
+        if len(self.statements) == 0:
+            return
+
+        fingerprints = self.fingerprints
+        try:
+            CURSOR.execute(";\n".join(self.statements), *self.params)
+            # Errors raised by later procedures in the batch only surface while stepping through results.
+            while CURSOR.nextset():
+                pass
+        except:
+            CNXN.rollback()
+            raise
+        finally:
+            self.statements = []
+            self.params = []
+            self.fingerprints = []
+
+        CNXN.commit()
+        if len(fingerprints) > 0:
+            ps_state.save_hashes("pc_write", fingerprints)
+
+
+def execute_update(sql, params, batch=None, fingerprint_key=None):
+    """Execute a single-row update procedure and commit, or queue it on batch if one is passed.
+
+    Keyword arguments:
+    fingerprint_key -- string like 'aid|target'. If write avoidance is enabled, the call is skipped when its
+        parameters match the last successful write for this key.
+    """
+    fingerprint = None
+    if fingerprint_key is not None and CONFIG.write_avoidance.enabled:
+        digest = ps_state.fingerprint([sql] + list(params))
+        if CONFIG.write_avoidance.max_age_hours is not None:
+            max_age = CONFIG.write_avoidance.max_age_hours * 3600
+        else:
+            max_age = None
+        if ps_state.is_unchanged("pc_write", fingerprint_key, digest, max_age):
+            return
+        fingerprint = (fingerprint_key, digest)
+
+    if batch is not None:
+        batch.add(sql, params, fingerprint)
+    else:
+        CURSOR.execute(sql, *params)
+        CNXN.commit()
+        if fingerprint is not None:
+            ps_state.save_hash("pc_write", *fingerprint)
+
+
+def update_demographics(app, batch=None):
+    execute_update(
         "execute [custom].[PS_updDemographics] ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?",
-        app["PEOPLE_CODE_ID"],
-        "SLATE",
-        app["GENDER"],
-        app["Ethnicity"],
-        app["DemographicsEthnicity"],
-        app["MARITALSTATUS"],
-        app["Religion"],
-        app["VETERAN"],
-        app["PRIMARYCITIZENSHIP"],
-        app["SECONDARYCITIZENSHIP"],
-        app["VISA"],
-        app["RaceAfricanAmerican"],
-        app["RaceAmericanIndian"],
-        app["RaceAsian"],
-        app["RaceNativeHawaiian"],
-        app["RaceWhite"],
-        app["PRIMARY_LANGUAGE"],
-        app["HOME_LANGUAGE"],
-        app["GovernmentId"],
+        [
+            app["PEOPLE_CODE_ID"],
+            "SLATE",
+            app["GENDER"],
+            app["Ethnicity"],
+            app["DemographicsEthnicity"],
+            app["MARITALSTATUS"],
+            app["Religion"],
+            app["VETERAN"],
+            app["PRIMARYCITIZENSHIP"],
+            app["SECONDARYCITIZENSHIP"],
+            app["VISA"],
+            app["RaceAfricanAmerican"],
+            app["RaceAmericanIndian"],
+            app["RaceAsian"],
+            app["RaceNativeHawaiian"],
+            app["RaceWhite"],
+            app["PRIMARY_LANGUAGE"],
+            app["HOME_LANGUAGE"],
+            app["GovernmentId"],
+        ],
+        batch,
+        app["aid"] + "|demographics",
     )
-    CNXN.commit()
 
 
-def update_academic(app):
+def update_academic(app, batch=None):
     """ "
     Update ACADEMIC row data in PowerCampus.
     Work around PowerCampus defect CR-XXXXXXXXX, where the campus passed to the API isn't written to ACADEMIC:
         If ACADEMIC_FLAG isn't yet set to Y, update ACADEMIC.ORG_CODE_ID based on the passed OrganizationId.
     """
-    CURSOR.execute(
+    execute_update(
         "exec [custom].[PS_updAcademicAppInfo] ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?",
-        app["PEOPLE_CODE_ID"],
-        app["ACADEMIC_YEAR"],
-        app["ACADEMIC_TERM"],
-        app["ACADEMIC_SESSION"],
-        app["PROGRAM"],
-        app["DEGREE"],
-        app["CURRICULUM"],
-        app["Department"],
-        app["Nontraditional"],
-        app["Population"],
-        app["AdmitDate"],
-        app["Matriculated"],
-        app["OrganizationId"],
-        app["AppStatus"],
-        app["AppStatusDate"],
-        app["AppDecision"],
-        app["AppDecisionDate"],
-        app["Counselor"],
-        app["COLLEGE_ATTEND"],
-        app["Extracurricular"],
-        app["CreateDateTime"],
+        [
+            app["PEOPLE_CODE_ID"],
+            app["ACADEMIC_YEAR"],
+            app["ACADEMIC_TERM"],
+            app["ACADEMIC_SESSION"],
+            app["PROGRAM"],
+            app["DEGREE"],
+            app["CURRICULUM"],
+            app["Department"],
+            app["Nontraditional"],
+            app["Population"],
+            app["AdmitDate"],
+            app["Matriculated"],
+            app["OrganizationId"],
+            app["AppStatus"],
+            app["AppStatusDate"],
+            app["AppDecision"],
+            app["AppDecisionDate"],
+            app["Counselor"],
+            app["COLLEGE_ATTEND"],
+            app["Extracurricular"],
+            app["CreateDateTime"],
+        ],
+        batch,
+        app["aid"] + "|academic",
     )
-    CNXN.commit()
 
 
-def update_academic_key(app):
+def update_academic_key(app, batch=None):
     """Track unique row GUID in custom.AcademicKey table and update PROGRAM/DEGREE/CURRICULUM columns in ACADEMIC table.
     P/C/D will only be updated if application is not registered and does not have an academic plan assigned.
     """
-    CURSOR.execute(
+    execute_update(
         "exec [custom].[PS_updAcademicKey] ?, ?, ?, ?, ?, ?, ?, ?",
-        app["PEOPLE_CODE_ID"],
-        app["ACADEMIC_YEAR"],
-        app["ACADEMIC_TERM"],
-        app["ACADEMIC_SESSION"],
-        app["PROGRAM"],
-        app["DEGREE"],
-        app["CURRICULUM"],
-        app["aid"],
+        [
+            app["PEOPLE_CODE_ID"],
+            app["ACADEMIC_YEAR"],
+            app["ACADEMIC_TERM"],
+            app["ACADEMIC_SESSION"],
+            app["PROGRAM"],
+            app["DEGREE"],
+            app["CURRICULUM"],
+            app["aid"],
+        ],
+        batch,
     )
-    CNXN.commit()
 
 
 def get_action_definition(action_id):
@@ -652,36 +1047,32 @@ def cleanup_actions(
         CNXN.commit()
 
 
-def update_smsoptin(app):
+def update_smsoptin(app, batch=None):
     if "SMSOptIn" in app:
-        CURSOR.execute(
+        execute_update(
             "exec [custom].[PS_updSMSOptIn] ?, ?, ?",
-            app["PEOPLE_CODE_ID"],
-            "SLATE",
-            app["SMSOptIn"],
+            [app["PEOPLE_CODE_ID"], "SLATE", app["SMSOptIn"]],
+            batch,
+            app["aid"] + "|smsoptin",
         )
-        CNXN.commit()
 
 
-def update_note(app, field, office, note_type):
-    CURSOR.execute(
+def update_note(app, field, office, note_type, batch=None):
+    execute_update(
         "exec [custom].[PS_insNote] ?, ?, ?, ?",
-        app["PEOPLE_CODE_ID"],
-        office,
-        note_type,
-        app[field],
+        [app["PEOPLE_CODE_ID"], office, note_type, app[field]],
+        batch,
+        app["aid"] + "|note|" + field,
     )
-    CNXN.commit()
 
 
-def update_udf(app, slate_field, pc_field):
-    CURSOR.execute(
+def update_udf(app, slate_field, pc_field, batch=None):
+    execute_update(
         "exec [custom].[PS_updUserDefined] ?, ?, ?",
-        app["PEOPLE_CODE_ID"],
-        pc_field,
-        app[slate_field],
+        [app["PEOPLE_CODE_ID"], pc_field, app[slate_field]],
+        batch,
+        app["aid"] + "|udf|" + pc_field,
     )
-    CNXN.commit()
 
 
 def update_education(pcid, pid, education):
@@ -787,21 +1178,23 @@ def update_test_scores(pcid, test):
     CNXN.commit()
 
 
-def update_stop(pcid, stop):
+def update_stop(pcid, stop, batch=None):
     """Insert or update a row in STOPLIST.
     If StopCode and StopDate match an existing row, update the row. Otherwise, insert a new row.
     """
-    CURSOR.execute(
+    execute_update(
         "exec [custom].[PS_updStop] ?, ?, ?, ?, ? ,? ,?",
-        pcid,
-        stop.stop_code,
-        stop.stop_date,
-        stop.cleared,
-        stop.cleared_date,
-        stop.comments,
-        "SLATE",
+        [
+            pcid,
+            stop.stop_code,
+            stop.stop_date,
+            stop.cleared,
+            stop.cleared_date,
+            stop.comments,
+            "SLATE",
+        ],
+        batch,
     )
-    CNXN.commit()
 
 
 def update_app_form_autoprocess(app_form_setting_id, autoprocess):
@@ -856,3 +1249,70 @@ def pf_get_awards(pcid, govid, year, term, session):
         tracking_status = row.tracking_status
 
     return awards, tracking_status
+
+
+def pf_keys_json(keys):
+    """Serialize a list of (pcid, govid, year, term, session) tuples for the set-based PowerFAIDS procedures."""
+    return json.dumps(
+        [
+            {
+                "i": i,
+                "pcid": k[0],
+                "govid": k[1],
+                "year": k[2],
+                "term": k[3],
+                "session": k[4],
+            }
+            for i, k in enumerate(keys)
+        ]
+    )
+
+
+def pf_get_awards_batch(keys, chunk_size=500):
+    """Return PowerFAIDS awards XML and Tracking Status for many applications.
+
+    Keyword arguments:
+    keys -- list of tuples like (pcid, govid, year, term, session)
+
+    Returns:
+    dict like {key: (awards, tracking_status)}. Keys with no PowerFAIDS record map to (None, None).
+    """
+    results = {k: (None, None) for k in keys}
+    found = set()
+
+    for start in range(0, len(keys), chunk_size):
+        chunk = keys[start : start + chunk_size]
+        CURSOR.execute("exec [custom].[PS_selPFAwardsXMLBatch] ?", pf_keys_json(chunk))
+        for row in CURSOR.fetchall():
+            # Like pf_get_awards(), keep the first row returned for each key
+            key = chunk[row.KeyIndex]
+            if key not in found:
+                found.add(key)
+                results[key] = (row.XML, row.tracking_status)
+
+    return results
+
+
+def pf_get_fachecklist_batch(keys, chunk_size=500):
+    """Return the PowerFAIDS missing docs lists for many applications, for uploading to Financial Aid Checklist.
+
+    Keyword arguments:
+    keys -- list of tuples like (pcid, govid, appid, year, term, session)
+    """
+    checklist = []
+
+    for start in range(0, len(keys), chunk_size):
+        chunk = keys[start : start + chunk_size]
+        CURSOR.execute(
+            "exec [custom].[PS_selPFChecklistBatch] ?",
+            pf_keys_json([(k[0], k[1], k[3], k[4], k[5]) for k in chunk]),
+        )
+
+        columns = [column[0] for column in CURSOR.description]
+        for row in CURSOR.fetchall():
+            doc = dict(zip(columns, row))
+            # Pass through the Slate Application ID
+            doc["AppID"] = chunk[doc.pop("KeyIndex")][2]
+            checklist.append(doc)
+
+    return checklist
@@ -0,0 +1,139 @@
+import contextlib
+import cProfile
+import datetime
+import io
+import pstats
+import time
+import tracemalloc
+import ps_metrics
+
+# Profiling for the command-line entry points' --profile option. Nothing here is imported unless it is used.
+# cProfile only sees the thread that started it, so work on other threads (like fa_processing.concurrent) is missed.
+TOP = 30
+PROFILER = None
+STAGES = {}
+CURRENT = None
+
+
+def take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces(
+        (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        )
+    )
+
+
+def close_stage():
+    """Add the allocations since the current stage started to its totals."""
+    name, started, snapshot = CURRENT
+    peak = tracemalloc.get_traced_memory()[1]
+    s = STAGES.setdefault(
+        name, {"count": 0, "seconds": 0.0, "peak": 0, "net": 0, "sites": {}}
+    )
+    s["count"] += 1
+    s["seconds"] += time.perf_counter() - started
+    s["peak"] = max(s["peak"], peak)
+    for diff in take_snapshot().compare_to(snapshot, "lineno"):
+        s["net"] += diff.size_diff
+        site = s["sites"].setdefault(str(diff.traceback), [0, 0])
+        site[0] += diff.size_diff
+        site[1] += diff.count_diff
+
+
+def open_stage(name):
+    global CURRENT
+
+    tracemalloc.reset_peak()
+    CURRENT = (name, time.perf_counter(), take_snapshot())
+
+
+def stage_started(name):
+    """ps_metrics stage hook. Snapshots are kept out of the CPU profile."""
+    PROFILER.disable()
+    close_stage()
+    open_stage(name if name is not None else "(after run)")
+    PROFILER.enable()
+
+
+def report(label, started, seconds):
+    """Return the profile as text: memory by stage, then functions by cumulative and internal time."""
+    lines = [
+        "Profile of "
+        + label
+        + " started "
+        + started
+        + ", "
+        + format(seconds, ".1f")
+        + "s",
+        "",
+        "Memory by stage. Peak is traced memory; sites are ranked by net bytes allocated and not freed.",
+    ]
+    for name, s in STAGES.items():
+        lines.append("")
+        lines.append(
+            name
+            + ": "
+            + format(s["seconds"], ".2f")
+            + "s x"
+            + str(s["count"])
+            + ", peak "
+            + format(s["peak"] / 1024 / 1024, ".1f")
+            + " MB, net "
+            + format(s["net"] / 1024, "+.0f")
+            + " KiB"
+        )
+        sites = sorted(s["sites"].items(), key=lambda item: item[1][0], reverse=True)
+        for site, (size, blocks) in sites[:TOP]:
+            if size <= 0:
+                break
+            lines.append(
+                "  "
+                + format(size / 1024, "+10.1f")
+                + " KiB "
+                + format(blocks, "+8d")
+                + " blocks  "
+                + site
+            )
+
+    for sort, title in [("cumulative", "cumulative"), ("tottime", "internal")]:
+        out = io.StringIO()
+        pstats.Stats(PROFILER, stream=out).sort_stats(sort).print_stats(TOP)
+        lines.append("")
+        lines.append("Functions by " + title + " time")
+        lines.append(out.getvalue())
+
+    return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def profiled(path, label):
+    """Profile the enclosed block with cProfile and tracemalloc, then write a report to path.
+
+    Raw cProfile data is also written to path + ".prof" for tools like snakeviz.
+    Memory is broken down by ps_metrics stage; allocations outside a sync run are grouped as setup or after run.
+    """
+    global PROFILER
+    global STAGES
+
+    STAGES = {}
+    started = datetime.datetime.now().isoformat()
+    clock = time.perf_counter()
+    tracemalloc.start()
+    open_stage("(setup)")
+    ps_metrics.STAGE_HOOK = stage_started
+    PROFILER = cProfile.Profile()
+    PROFILER.enable()
+    try:
+        yield
+    finally:
+        PROFILER.disable()
+        ps_metrics.STAGE_HOOK = None
+        close_stage()
+        tracemalloc.stop()
+
+        PROFILER.dump_stats(path + ".prof")
+        with open(path, "w") as file:
+            file.write(report(label, started, time.perf_counter() - clock))
+        print("Profile written to " + path)
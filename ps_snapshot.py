@@ -0,0 +1,172 @@
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import re
+import secrets
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Snapshots of the raw Slate applications and scheduled actions responses, for replaying real-shape workloads offline.
+# Each sync writes its own gzipped JSON lines file: a header line, then one line per app or action.
+SNAPSHOT_DIR = None
+REDACT_PII = False
+REDACT_FIELDS = []
+RUNS = threading.local()
+
+PII_FIELDS = [
+    "FirstName",
+    "MiddleName",
+    "LastName",
+    "LastNamePrefix",
+    "Nickname",
+    "LegalName",
+    "FormerFirstName",
+    "FormerLastName",
+    "Email",
+    "BirthDate",
+    "GovernmentId",
+]
+PII_PATTERN = re.compile(r"^(Address\d+(Line\d|City|PostalCode)|Phone\d+Number)$")
+
+# Query string parameters that authenticate a Slate query URL
+SECRET_PARAMS = ["h", "password", "pwd", "token", "key", "secret", "signature"]
+
+
+def init(snapshot_dir=None, redact_pii=False, redact_fields=None):
+    """Configure snapshots.
+
+    Keyword arguments:
+    snapshot_dir -- directory snapshot files are written to, or None to not record
+    redact_pii -- replace names, contact details, birth dates, and government IDs with same-shaped pseudonyms
+    redact_fields -- additional Slate fields to redact
+    """
+    global SNAPSHOT_DIR
+    global REDACT_PII
+    global REDACT_FIELDS
+
+    SNAPSHOT_DIR = snapshot_dir
+    REDACT_PII = redact_pii
+    REDACT_FIELDS = redact_fields or []
+    if SNAPSHOT_DIR is not None:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+
+
+def redact_url(url):
+    """Remove credentials from a URL's user info and query string."""
+    parts = urlsplit(url)
+    netloc = parts.netloc.rsplit("@", 1)[-1]
+    query = urlencode(
+        [
+            (k, "REDACTED" if k.lower() in SECRET_PARAMS else v)
+            for (k, v) in parse_qsl(parts.query, keep_blank_values=True)
+        ]
+    )
+    return urlunsplit((parts.scheme, netloc, parts.path, query, parts.fragment))
+
+
+def pseudonym(value):
+    """Return a value of the same shape, replacing each letter and digit.
+
+    The same value always gets the same pseudonym within a snapshot, but the salt isn't saved, so it can't be reversed.
+    """
+    out = []
+    digest = b""
+    for i, c in enumerate(value):
+        if i % 32 == 0:
+            digest = hashlib.sha256(
+                RUNS.salt + str(i).encode() + value.encode("utf8")
+            ).digest()
+        b = digest[i % 32]
+        if c.isdigit():
+            out.append(str(b % 10))
+        elif c.isalpha():
+            out.append(chr(ord("a") + b % 26))
+        else:
+            out.append(c)
+    return "".join(out)
+
+
+def redact(row):
+    """Return a copy of a Slate row with PII fields replaced."""
+    row = dict(row)
+    for k, v in row.items():
+        if not isinstance(v, str) or v == "":
+            continue
+        if k in REDACT_FIELDS or (
+            REDACT_PII and (k in PII_FIELDS or PII_PATTERN.match(k))
+        ):
+            if k == "BirthDate":
+                # Keep the year, so age-based logic still sees a plausible date
+                row[k] = v[:4] + "-01-01" + v[10:]
+            else:
+                row[k] = pseudonym(v)
+    return row
+
+
+def start(pid, url):
+    """Open a new snapshot file for the calling thread's sync. Does nothing unless recording."""
+    if SNAPSHOT_DIR is None:
+        RUNS.path = None
+        return
+    now = datetime.datetime.now()
+    RUNS.path = os.path.join(
+        SNAPSHOT_DIR,
+        "slate_"
+        + now.strftime("%Y%m%d_%H%M%S_%f")
+        + "_"
+        + str(threading.get_ident())
+        + ".jsonl.gz",
+    )
+    RUNS.salt = secrets.token_bytes(16)
+    write(
+        [
+            {
+                "type": "header",
+                "started": now.isoformat(),
+                "pid": pid,
+                "url": redact_url(url),
+                "redacted": REDACT_PII or len(REDACT_FIELDS) > 0,
+            }
+        ]
+    )
+
+
+def record(kind, rows):
+    """Append Slate rows of a kind ("app" or "action") to the calling thread's snapshot, if one is open."""
+    if getattr(RUNS, "path", None) is None:
+        return
+    if REDACT_PII or len(REDACT_FIELDS) > 0:
+        rows = (redact(row) for row in rows)
+    write({"type": kind, "row": row} for row in rows)
+
+
+def write(lines):
+    # Each call appends a gzip member; readers see one continuous stream
+    with gzip.open(RUNS.path, "at", encoding="utf8") as file:
+        for line in lines:
+            file.write(json.dumps(line) + "\n")
+
+
+def load(path):
+    """Read a snapshot file.
+
+    Returns:
+    header -- dict describing the recorded sync
+    apps -- list of app rows, as the Slate applications query returned them
+    actions -- dict of {aid: list of action rows}
+    """
+    header = None
+    apps = []
+    actions = {}
+    with gzip.open(path, "rt", encoding="utf8") as file:
+        for line in file:
+            item = json.loads(line)
+            if item["type"] == "header":
+                header = item
+            elif item["type"] == "app":
+                apps.append(item["row"])
+            elif item["type"] == "action":
+                actions.setdefault(item["row"]["aid"], []).append(item["row"])
+    return header, apps, actions
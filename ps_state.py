@@ -0,0 +1,377 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+# Local state that persists between runs, kept in a SQLite file.
+# The database is only created once something actually uses it.
+DATABASE_PATH = None
+CNXN = None
+LOCK = threading.Lock()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    checked REAL NOT NULL,
+    changed REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE TABLE IF NOT EXISTS cache (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    stored REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS cache_stored ON cache (namespace, stored);
+CREATE TABLE IF NOT EXISTS sync_log (
+    aid TEXT PRIMARY KEY,
+    hash TEXT,
+    synced REAL,
+    owner TEXT,
+    expires REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS runs (
+    name TEXT PRIMARY KEY,
+    started TEXT,
+    finished REAL NOT NULL,
+    seconds REAL,
+    status TEXT
+);
+CREATE TABLE IF NOT EXISTS locks (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+def init(database_path):
+    global DATABASE_PATH
+
+    de_init()
+    DATABASE_PATH = database_path
+
+
+def de_init():
+    global CNXN
+
+    with LOCK:
+        if CNXN is not None:
+            CNXN.close()
+            CNXN = None
+
+
+def connect():
+    """Return the shared SQLite connection, opening it and creating tables on first use."""
+    global CNXN
+
+    if CNXN is None:
+        if DATABASE_PATH is None:
+            raise RuntimeError(
+                "ps_state.init() must be called before using local state."
+            )
+        CNXN = sqlite3.connect(DATABASE_PATH, timeout=30, check_same_thread=False)
+        CNXN.executescript(SCHEMA)
+    return CNXN
+
+
+def fingerprint(values):
+    """Return a stable hash of a list of values, such as the parameters of a stored procedure call."""
+    return hashlib.sha256(
+        json.dumps(values, default=str, sort_keys=True).encode("utf8")
+    ).hexdigest()
+
+
+def get_hash(namespace, key):
+    """Return (hash, checked, changed) for a key, or None if it has never been saved."""
+    with LOCK:
+        row = (
+            connect()
+            .execute(
+                "SELECT hash, checked, changed FROM fingerprints WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            )
+            .fetchone()
+        )
+    return row
+
+
+def get_hashes(namespace, keys=None, chunk_size=500):
+    """Return a dict of {key: (hash, checked, changed)} for a list of keys, or every saved key in a namespace.
+
+    Keys are looked up chunk_size at a time, to stay under SQLite's limit on query parameters.
+    """
+    if keys is None:
+        with LOCK:
+            rows = (
+                connect()
+                .execute(
+                    "SELECT key, hash, checked, changed FROM fingerprints WHERE namespace = ?",
+                    (namespace,),
+                )
+                .fetchall()
+            )
+        return {row[0]: row[1:] for row in rows}
+
+    keys = list(keys)
+    results = {}
+    for start in range(0, len(keys), chunk_size):
+        chunk = keys[start : start + chunk_size]
+        with LOCK:
+            rows = (
+                connect()
+                .execute(
+                    "SELECT key, hash, checked, changed FROM fingerprints WHERE namespace = ? AND key IN ("
+                    + ",".join("?" * len(chunk))
+                    + ")",
+                    [namespace] + chunk,
+                )
+                .fetchall()
+            )
+        results.update({row[0]: row[1:] for row in rows})
+    return results
+
+
+def is_unchanged(namespace, key, digest, max_age=None):
+    """Return True if digest matches the saved hash for key.
+
+    Keyword arguments:
+    max_age -- seconds. If the saved hash is older than this, treat it as changed so the write is refreshed.
+    """
+    row = get_hash(namespace, key)
+    if row is None or row[0] != digest:
+        return False
+    if max_age is not None and time.time() - row[1] > max_age:
+        return False
+    return True
+
+
+def save_hashes(namespace, items):
+    """Save a list of (key, hash) tuples. 'changed' only moves forward when the hash differs."""
+    now = time.time()
+    with LOCK:
+        cnxn = connect()
+        cnxn.executemany(
+            """INSERT INTO fingerprints (namespace, key, hash, checked, changed)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (namespace, key) DO UPDATE SET
+                changed = CASE WHEN hash = excluded.hash THEN changed ELSE excluded.changed END,
+                hash = excluded.hash,
+                checked = excluded.checked""",
+            [(namespace, key, digest, now, now) for (key, digest) in items],
+        )
+        cnxn.commit()
+
+
+def save_hash(namespace, key, digest):
+    save_hashes(namespace, [(key, digest)])
+
+
+def cache_key(key):
+    """Cache keys may be tuples; store them as JSON strings."""
+    return json.dumps(key, default=str)
+
+
+def cache_get_many(namespace, keys, ttl):
+    """Return a dict of {key: value} for keys that have a cached value younger than ttl seconds."""
+    oldest = time.time() - ttl
+    results = {}
+    with LOCK:
+        cnxn = connect()
+        for key in keys:
+            row = cnxn.execute(
+                "SELECT value FROM cache WHERE namespace = ? AND key = ? AND stored >= ?",
+                (namespace, cache_key(key), oldest),
+            ).fetchone()
+            if row is not None:
+                results[key] = json.loads(row[0])
+    return results
+
+
+def cache_put_many(namespace, items, ttl, max_entries=None):
+    """Store a dict of {key: value} in the cache, then evict expired entries and the oldest entries beyond max_entries."""
+    now = time.time()
+    with LOCK:
+        cnxn = connect()
+        cnxn.executemany(
+            "INSERT OR REPLACE INTO cache (namespace, key, value, stored) VALUES (?, ?, ?, ?)",
+            [
+                (namespace, cache_key(k), json.dumps(v, default=str), now)
+                for (k, v) in items.items()
+            ],
+        )
+        cnxn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND stored < ?",
+            (namespace, now - ttl),
+        )
+        if max_entries is not None:
+            # Only rank the namespace when it is actually over the limit
+            count = cnxn.execute(
+                "SELECT COUNT(*) FROM cache WHERE namespace = ?", (namespace,)
+            ).fetchone()[0]
+            if count > max_entries:
+                cnxn.execute(
+                    """DELETE FROM cache WHERE namespace = ? AND key NOT IN (
+                        SELECT key FROM cache WHERE namespace = ? ORDER BY stored DESC LIMIT ?
+                    )""",
+                    (namespace, namespace, max_entries),
+                )
+        cnxn.commit()
+
+
+def cache_clear(namespace):
+    with LOCK:
+        cnxn = connect()
+        cnxn.execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
+        cnxn.commit()
+
+
+def acquire_lock(name, owner, ttl):
+    """Take a named lease for ttl seconds. Return False if another owner holds an unexpired lease.
+
+    Works across processes sharing the same database file.
+    """
+    now = time.time()
+    with LOCK:
+        cnxn = connect()
+        cnxn.execute("BEGIN IMMEDIATE")
+        try:
+            row = cnxn.execute(
+                "SELECT owner, expires FROM locks WHERE name = ?", (name,)
+            ).fetchone()
+            if row is not None and row[0] != owner and row[1] > now:
+                cnxn.rollback()
+                return False
+            cnxn.execute(
+                "INSERT OR REPLACE INTO locks (name, owner, expires) VALUES (?, ?, ?)",
+                (name, owner, now + ttl),
+            )
+            cnxn.commit()
+        except:
+            cnxn.rollback()
+            raise
+    return True
+
+
+def release_lock(name, owner):
+    with LOCK:
+        cnxn = connect()
+        cnxn.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+        cnxn.commit()
+
+
+def claim_syncs(items, owner, lease, skip_age=None):
+    """Lease applications for syncing so other processes sharing the database leave them alone.
+
+    Keyword arguments:
+    items -- dict of {aid: payload hash}
+    owner -- identifies the calling process and thread
+    lease -- seconds until an unfinished lease expires, in case the owner dies
+    skip_age -- seconds. If set, skip applications whose hash matches one synced more recently than this.
+
+    Returns:
+    claimed -- list of aids leased to owner
+    busy -- list of aids leased to another owner
+    """
+    now = time.time()
+    claimed = []
+    busy = []
+    with LOCK:
+        cnxn = connect()
+        cnxn.execute("BEGIN IMMEDIATE")
+        try:
+            for aid, digest in items.items():
+                row = cnxn.execute(
+                    "SELECT hash, synced, owner, expires FROM sync_log WHERE aid = ?",
+                    (aid,),
+                ).fetchone()
+                if row is not None:
+                    if row[2] is not None and row[2] != owner and row[3] > now:
+                        busy.append(aid)
+                        continue
+                    if (
+                        skip_age is not None
+                        and row[0] == digest
+                        and row[1] is not None
+                        and now - row[1] < skip_age
+                    ):
+                        continue
+                cnxn.execute(
+                    """INSERT INTO sync_log (aid, owner, expires) VALUES (?, ?, ?)
+                    ON CONFLICT (aid) DO UPDATE SET
+                        owner = excluded.owner,
+                        expires = excluded.expires""",
+                    (aid, owner, now + lease),
+                )
+                claimed.append(aid)
+            cnxn.commit()
+        except:
+            cnxn.rollback()
+            raise
+    return claimed, busy
+
+
+def finish_syncs(items, owner):
+    """Record a completed sync for a dict of {aid: payload hash} and release the leases."""
+    now = time.time()
+    with LOCK:
+        cnxn = connect()
+        cnxn.executemany(
+            """INSERT INTO sync_log (aid, hash, synced, owner, expires)
+            VALUES (?, ?, ?, NULL, 0)
+            ON CONFLICT (aid) DO UPDATE SET
+                hash = excluded.hash,
+                synced = excluded.synced,
+                owner = NULL,
+                expires = 0""",
+            [(aid, digest, now) for (aid, digest) in items.items()],
+        )
+        cnxn.commit()
+
+
+def release_syncs(owner, aids=None):
+    """Release leases held by owner without recording a sync, for a list of aids or all of them."""
+    with LOCK:
+        cnxn = connect()
+        if aids is None:
+            cnxn.execute(
+                "UPDATE sync_log SET owner = NULL, expires = 0 WHERE owner = ?",
+                (owner,),
+            )
+        else:
+            cnxn.executemany(
+                "UPDATE sync_log SET owner = NULL, expires = 0 WHERE aid = ? AND owner = ?",
+                [(aid, owner) for aid in aids],
+            )
+        cnxn.commit()
+
+
+def save_run(name, started, seconds, status):
+    """Remember the latest run of a kind, such as scheduled syncs, for other processes to report on."""
+    with LOCK:
+        cnxn = connect()
+        cnxn.execute(
+            "INSERT OR REPLACE INTO runs (name, started, finished, seconds, status) VALUES (?, ?, ?, ?, ?)",
+            (name, started, time.time(), seconds, status),
+        )
+        cnxn.commit()
+
+
+def get_run(name):
+    """Return the latest run of a kind as a dict, or None."""
+    with LOCK:
+        row = (
+            connect()
+            .execute(
+                "SELECT started, finished, seconds, status FROM runs WHERE name = ?",
+                (name,),
+            )
+            .fetchone()
+        )
+    if row is None:
+        return None
+    return {"started": row[0], "finished": row[1], "seconds": row[2], "status": row[3]}
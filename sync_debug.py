@@ -1,7 +1,27 @@
-import sys
+import argparse
+import contextlib
 import ps_core
 
 if __name__ == "__main__":
-    smtp_config = ps_core.init(sys.argv[1])
-    ps_core.main_sync()
-    ps_core.de_init()
+    parser = argparse.ArgumentParser(
+        description="Run one sync, without catching errors or sending email."
+    )
+    parser.add_argument("config", help="path to the configuration file")
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="write a CPU and memory profile of the run to this file",
+    )
+    args = parser.parse_args()
+
+    if args.profile:
+        import ps_profile
+
+        profile = ps_profile.profiled(args.profile, "sync_debug")
+    else:
+        profile = contextlib.nullcontext()
+
+    with profile:
+        smtp_config = ps_core.init(args.config)
+        ps_core.main_sync()
+        ps_core.de_init()
@@ -1,12 +1,24 @@
+import collections
+import json
+import math
 import sys
+import threading
+import time
 import traceback
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
 from http.server import BaseHTTPRequestHandler, HTTPServer
 import urllib
+import uuid
 import ps_core
+import ps_metrics
+import ps_powercampus
+import ps_state
 import socket
 
 
 CONFIG = ps_core.init(sys.argv[1])
+HTTP_SETTINGS = ps_core.SETTINGS.http_server
+MSG_STRINGS = ps_core.SETTINGS.msg_strings
 
 
 def emit_traceback():
@@ -17,41 +29,539 @@ def emit_traceback():
     return message
 
 
+def sync_pid(pid):
+    """Sync one person record, or a tuple of person records, recovering and retrying once on error.
+
+    Only the calling worker's SQL connection and HTTP sessions are reset, so other syncs are unaffected.
+
+    Returns:
+    message -- text for the user
+    ok -- False if the sync failed
+    """
+    try:
+        return ps_core.main_sync(pid), True
+    except ps_core.SyncBusy:
+        # Leased by another process; the caller answers 503 rather than retrying now
+        raise
+    except Exception as ex:
+        # Reset connections and try one more time before returning an error to the user
+        print("Attempting to recover from error:", emit_traceback())
+        try:
+            ps_core.recover()
+            return ps_core.main_sync(pid), True
+        except ps_core.SyncBusy:
+            raise
+        except Exception:
+            message = emit_traceback()
+            try:
+                ps_core.recover()
+            except Exception:
+                print("Recovery failed:", emit_traceback())
+            return message, False
+
+
+class QueueFull(Exception):
+    """Raised when the sync queue is at capacity."""
+
+
+class SyncExpired(Exception):
+    """Raised when a queued sync waited past its deadline before it could start."""
+
+
+class SyncCoalescer:
+    """Run syncs on a bounded pool of worker threads, avoiding duplicate syncs of the same pid.
+
+    Each worker thread keeps its own PowerCampus SQL connection between syncs.
+    Requests for a pid (or tuple of pids) that is already queued or running share that sync's future.
+    A successful result is also returned to repeat requests for debounce_seconds after it finished.
+    At most max_queue syncs wait for a worker, and a sync that waited longer than deadline_seconds is dropped.
+    """
+
+    def __init__(
+        self, max_workers, debounce_seconds=0, max_queue=None, deadline_seconds=None
+    ):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="sync"
+        )
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.deadline_seconds = deadline_seconds
+        self.debounce_seconds = debounce_seconds
+        # Reentrant because done callbacks run immediately if a future is already finished.
+        self.lock = threading.RLock()
+        self.in_flight = {}
+        self.recent = {}
+        self.running = 0
+
+    def submit(self, pid):
+        """Return a Future for the sync of pid. Its result is (message, ok)."""
+        with self.lock:
+            now = time.monotonic()
+            self.recent = {
+                k: v
+                for (k, v) in self.recent.items()
+                if now - v[0] < self.debounce_seconds
+            }
+            if pid in self.recent:
+                future = Future()
+                future.set_result((self.recent[pid][1], True))
+                return future
+
+            if pid in self.in_flight:
+                return self.in_flight[pid]
+
+            if (
+                self.max_queue is not None
+                and len(self.in_flight) >= self.max_workers + self.max_queue
+            ):
+                raise QueueFull
+
+            future = self.executor.submit(self.run, pid, now)
+            self.in_flight[pid] = future
+            future.add_done_callback(lambda f: self.finished(pid, f))
+            return future
+
+    def run(self, pid, queued_at):
+        if (
+            self.deadline_seconds is not None
+            and time.monotonic() - queued_at > self.deadline_seconds
+        ):
+            raise SyncExpired
+        with self.lock:
+            self.running += 1
+        start = time.perf_counter()
+        try:
+            message, ok = sync_pid(pid)
+        except ps_core.SyncBusy:
+            METRICS.sync_finished(time.perf_counter() - start, "busy")
+            raise
+        finally:
+            with self.lock:
+                self.running -= 1
+        METRICS.sync_finished(time.perf_counter() - start, "ok" if ok else "error")
+        return message, ok
+
+    def counts(self):
+        """Return (running, queued) sync counts."""
+        with self.lock:
+            return self.running, len(self.in_flight) - self.running
+
+    def finished(self, pid, future):
+        with self.lock:
+            del self.in_flight[pid]
+            if future.exception() is None and self.debounce_seconds > 0:
+                message, ok = future.result()
+                if ok:
+                    self.recent[pid] = (time.monotonic(), message)
+
+
+class SyncJobs:
+    """Track syncs started in async mode so their results can be polled by job id."""
+
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def add(self, future):
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            # Forget finished jobs nobody has collected
+            now = time.monotonic()
+            self.jobs = {
+                k: v
+                for (k, v) in self.jobs.items()
+                if not v[0].done() or now - v[1] < self.ttl_seconds
+            }
+            self.jobs[job_id] = (future, now)
+        return job_id
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        return job[0]
+
+
+def prometheus_labels(labels):
+    """Format a dict as a Prometheus label set, escaping values."""
+    if len(labels) == 0:
+        return ""
+    return (
+        "{"
+        + ",".join(
+            k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"'
+            for (k, v) in labels.items()
+        )
+        + "}"
+    )
+
+
+class SyncMetrics:
+    """Counters for the /metrics endpoint. Sync latency percentiles cover the most recent syncs."""
+
+    paths = ("/", "/batch", "/status", "/stats/sql", "/metrics", "/healthz")
+
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.requests = collections.Counter()
+        self.syncs = collections.Counter()
+        self.latencies = collections.deque(maxlen=window)
+        self.latency_sum = 0.0
+
+    def request(self, path, status):
+        if path not in self.paths:
+            path = "other"
+        with self.lock:
+            self.requests[(path, status)] += 1
+
+    def sync_finished(self, seconds, result):
+        """Record a finished sync. result is "ok", "error", or "busy"."""
+        with self.lock:
+            self.syncs[result] += 1
+            self.latencies.append(seconds)
+            self.latency_sum += seconds
+
+    def quantiles(self, qs):
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if len(latencies) == 0:
+            return {q: float("nan") for q in qs}
+        return {q: latencies[max(0, math.ceil(q * len(latencies)) - 1)] for q in qs}
+
+    def render(self, server):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append("# HELP powerslate_" + name + " " + help_text)
+            lines.append("# TYPE powerslate_" + name + " " + kind)
+            for labels, value in samples:
+                lines.append(
+                    "powerslate_" + name + prometheus_labels(labels) + " " + str(value)
+                )
+
+        with self.lock:
+            requests = sorted(self.requests.items())
+            syncs = sorted(self.syncs.items())
+            latency_count = sum(self.syncs.values())
+            latency_sum = self.latency_sum
+
+        metric(
+            "http_requests_total",
+            "counter",
+            "HTTP requests handled, by path and status.",
+            [({"path": p, "status": st}, n) for ((p, st), n) in requests],
+        )
+        running, queued = COALESCER.counts()
+        metric(
+            "syncs_in_flight",
+            "gauge",
+            "Syncs running on a worker or waiting for one.",
+            [({"state": "running"}, running), ({"state": "queued"}, queued)],
+        )
+        metric(
+            "syncs_total",
+            "counter",
+            "Finished on-demand syncs, by result.",
+            [({"result": r}, n) for (r, n) in syncs],
+        )
+        lines.append("# HELP powerslate_sync_duration_seconds On-demand sync latency.")
+        lines.append("# TYPE powerslate_sync_duration_seconds summary")
+        for q, v in self.quantiles((0.5, 0.95, 0.99)).items():
+            lines.append(
+                'powerslate_sync_duration_seconds{quantile="' + str(q) + '"} ' + str(v)
+            )
+        lines.append("powerslate_sync_duration_seconds_sum " + str(latency_sum))
+        lines.append("powerslate_sync_duration_seconds_count " + str(latency_count))
+        metric(
+            "round_trips_total",
+            "counter",
+            "SQL calls and HTTP requests made by syncs, by kind.",
+            [({"kind": k}, n) for (k, n) in sorted(ps_metrics.totals().items())],
+        )
+
+        sql = ps_metrics.sql_stats()
+        if len(sql["procedures"]) > 0:
+            lines.append(
+                "# HELP powerslate_sql_duration_seconds SQL call latency by procedure."
+            )
+            lines.append("# TYPE powerslate_sql_duration_seconds histogram")
+            for name, st in sql["procedures"].items():
+                cumulative = 0
+                for label, n in st["histogram"].items():
+                    cumulative += n
+                    le = label if label == "+Inf" else str(int(label) / 1000)
+                    lines.append(
+                        "powerslate_sql_duration_seconds_bucket"
+                        + prometheus_labels({"procedure": name, "le": le})
+                        + " "
+                        + str(cumulative)
+                    )
+                labels = prometheus_labels({"procedure": name})
+                lines.append(
+                    "powerslate_sql_duration_seconds_sum"
+                    + labels
+                    + " "
+                    + str(st["seconds"])
+                )
+                lines.append(
+                    "powerslate_sql_duration_seconds_count"
+                    + labels
+                    + " "
+                    + str(st["calls"])
+                )
+            metric(
+                "sql_rows_total",
+                "counter",
+                "Rows fetched by procedure.",
+                [
+                    ({"procedure": n}, st["rows"])
+                    for (n, st) in sql["procedures"].items()
+                ],
+            )
+
+        metric(
+            "sql_connections_open",
+            "gauge",
+            "Open PowerCampus SQL connections, one per thread that has used one.",
+            [({}, len(ps_powercampus.CNXN.open_connections))],
+        )
+        if isinstance(server, PooledHTTPServer):
+            metric(
+                "http_connections_active",
+                "gauge",
+                "HTTP connections being handled or waiting for a handler thread.",
+                [({}, server.active)],
+            )
+
+        last = ps_state.get_run("scheduled")
+        if last is not None:
+            metric(
+                "last_scheduled_run_duration_seconds",
+                "gauge",
+                "Duration of the latest scheduled sync.",
+                [({}, last["seconds"])],
+            )
+            metric(
+                "last_scheduled_run_timestamp_seconds",
+                "gauge",
+                "When the latest scheduled sync finished.",
+                [({}, last["finished"])],
+            )
+            metric(
+                "last_scheduled_run_success",
+                "gauge",
+                "1 if the latest scheduled sync succeeded.",
+                [({}, 1 if last["status"] == "ok" else 0)],
+            )
+
+        return "\n".join(lines) + "\n"
+
+
+def health():
+    """Return (status, body) for /healthz. Unhealthy if SQL is unreachable or the sync queue is full."""
+    database = ps_powercampus.probe_database()
+    running, queued = COALESCER.counts()
+    queue_full = (
+        HTTP_SETTINGS.max_queue is not None
+        and running + queued
+        >= HTTP_SETTINGS.max_concurrent_syncs + HTTP_SETTINGS.max_queue
+    )
+    ok = database and not queue_full
+    body = {
+        "status": "ok" if ok else "unhealthy",
+        "database": database,
+        "syncs_running": running,
+        "syncs_queued": queued,
+        "queue_full": queue_full,
+    }
+    return (200 if ok else 503), json.dumps(body)
+
+
+METRICS = SyncMetrics()
+COALESCER = SyncCoalescer(
+    HTTP_SETTINGS.max_concurrent_syncs,
+    HTTP_SETTINGS.debounce_seconds,
+    HTTP_SETTINGS.max_queue,
+    HTTP_SETTINGS.request_timeout_seconds,
+)
+JOBS = SyncJobs(HTTP_SETTINGS.job_ttl_seconds)
+
+
+def progress_page(job_id):
+    """HTML that tells the user a sync is running and reloads the job's status page until it finishes."""
+    status_url = "/status?" + urllib.parse.urlencode({"job": job_id})
+    return (
+        '<html><head><meta http-equiv="refresh" content="'
+        + str(HTTP_SETTINGS.poll_seconds)
+        + ";url="
+        + status_url
+        + '" /></head><body><p>Sync in progress...</p><p>Job: '
+        + job_id
+        + "</p></body></html>"
+    )
+
+
 class testHTTPServer_RequestHandler(BaseHTTPRequestHandler):
     def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        q = urllib.parse.parse_qs(url.query)
+        print(q)  # Debug
+
+        status = 200
+        retry_after = None
+        content_type = "text/html"
+        if url.path == "/metrics":
+            content_type = "text/plain; version=0.0.4"
+            message = METRICS.render(self.server)
+        elif url.path == "/healthz":
+            content_type = "application/json"
+            status, message = health()
+        elif url.path == "/stats/sql":
+            # SQL call counts, latency histograms, and row counts since the server started
+            content_type = "application/json"
+            message = json.dumps(ps_metrics.sql_stats(), indent=4)
+        elif url.path == "/status":
+            # Poll an async job
+            future = None
+            if "job" in q:
+                future = JOBS.get(q["job"][0])
+            if future is None:
+                status = 404
+                message = "Error: Job not found."
+            elif future.done():
+                try:
+                    message, ok = future.result()
+                except (SyncExpired, ps_core.SyncBusy):
+                    status = 503
+                    retry_after = HTTP_SETTINGS.retry_after_seconds
+                    message = MSG_STRINGS.error_sync_busy
+            else:
+                message = progress_page(q["job"][0])
+        elif url.path == "/batch" and "pid" in q:
+            # Sync many person records in one pass. Accepts repeated and/or comma-separated pid parameters.
+            pids = tuple(
+                sorted({p.strip() for v in q["pid"] for p in v.split(",") if p.strip()})
+            )
+            if len(pids) > HTTP_SETTINGS.max_batch_pids:
+                status = 400
+                message = (
+                    "Error: At most "
+                    + str(HTTP_SETTINGS.max_batch_pids)
+                    + " records may be synced in one batch."
+                )
+            else:
+                status, message = self.run_sync(pids, q)
+        elif "pid" in q:
+            # Check for expected HTTP parameter, then sync that particular person record
+            status, message = self.run_sync(q["pid"][0], q)
+        else:
+            message = "Error: Record not found."
+
+        if status == 503:
+            retry_after = HTTP_SETTINGS.retry_after_seconds
+        METRICS.request(url.path, status)
+
         # Send response status code
-        self.send_response(200)
+        self.send_response(status)
 
         # Send headers
-        self.send_header("Content-type", "text/html")
+        self.send_header("Content-type", content_type)
+        if retry_after is not None:
+            self.send_header("Retry-After", str(retry_after))
         self.end_headers()
 
-        # Send message back to client
-        q = urllib.parse.parse_qs(self.path[2:])
-        print(q)  # Debug
-
-        # Check for expected HTTP parameter, then sync that particular person record
-        try:
-            if "pid" in q:
-                message = ps_core.main_sync(q["pid"][0])
-            else:
-                message = "Error: Record not found."
-        except Exception as ex:
-            # Re-initialize and try one more time before returning an error to the user
-            print("Attempting to recover from error:", emit_traceback())
-            try:
-                ps_core.de_init()
-                CONFIG = ps_core.init(sys.argv[1])
-                message = ps_core.main_sync(q["pid"][0])
-            except Exception:
-                message = emit_traceback()
-                ps_core.de_init()
-                CONFIG = ps_core.init(sys.argv[1])
-
         # Write content as utf-8 data
         self.wfile.write(message.encode("utf8"))
         return
 
+    def run_sync(self, pid, q):
+        """Start a sync and wait for it, or return a job page in async mode. Returns (status, message)."""
+        try:
+            future = COALESCER.submit(pid)
+        except QueueFull:
+            return 503, MSG_STRINGS.error_sync_busy
+
+        if HTTP_SETTINGS.async_jobs or q.get("async") == ["1"]:
+            job_id = JOBS.add(future)
+            return 202, progress_page(job_id)
+
+        try:
+            message, ok = future.result(timeout=HTTP_SETTINGS.request_timeout_seconds)
+        except (SyncExpired, ps_core.SyncBusy):
+            return 503, MSG_STRINGS.error_sync_busy
+        except TimeoutError:
+            # The sync keeps running; a retry will join it or get its debounced result.
+            return 503, MSG_STRINGS.error_sync_timeout
+        return 200, message
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that handles requests on a bounded pool of threads.
+
+    Syncs themselves run on the SyncCoalescer's workers, so handler threads stay free to answer
+    status polls while syncs are running. Requests beyond max_workers wait for a free thread,
+    up to max_connections in total, or without limit if it is None. Beyond that, connections get an immediate 503.
+    """
+
+    def __init__(
+        self, server_address, RequestHandlerClass, max_workers, max_connections
+    ):
+        # Created first, because a failed bind calls server_close()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="http"
+        )
+        super().__init__(server_address, RequestHandlerClass)
+        if max_connections is None:
+            self.slots = None
+        else:
+            self.slots = threading.BoundedSemaphore(max(max_workers, max_connections))
+        self.active_lock = threading.Lock()
+        self.active = 0
+
+    def process_request(self, request, client_address):
+        if self.slots is not None and not self.slots.acquire(blocking=False):
+            METRICS.request("other", 503)
+            self.reject_request(request)
+            return
+        with self.active_lock:
+            self.active += 1
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self.active_lock:
+                self.active -= 1
+            if self.slots is not None:
+                self.slots.release()
+
+    def reject_request(self, request):
+        """Answer 503 without reading the request, so an overloaded server stays responsive."""
+        try:
+            request.sendall(
+                (
+                    "HTTP/1.0 503 Service Unavailable\r\n"
+                    + "Retry-After: "
+                    + str(HTTP_SETTINGS.retry_after_seconds)
+                    + "\r\nContent-Type: text/html\r\nConnection: close\r\n\r\n"
+                    + MSG_STRINGS.error_sync_busy
+                ).encode("utf8")
+            )
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
 
 def run_server():
     # Run the web server and idle indefinitely, listening for requests.
@@ -65,7 +575,22 @@ def run_server():
     else:
         local_ip = socket.gethostbyname(socket.gethostname())
     server_address = (local_ip, CONFIG["http_port"])
-    httpd = HTTPServer(server_address, testHTTPServer_RequestHandler)
+    # The queue and connection limits only take effect when requests are handled on a pool of threads
+    if (
+        HTTP_SETTINGS.max_concurrent_syncs > 1
+        or HTTP_SETTINGS.async_jobs
+        or HTTP_SETTINGS.max_queue is not None
+        or HTTP_SETTINGS.max_connections is not None
+    ):
+        httpd = PooledHTTPServer(
+            server_address,
+            testHTTPServer_RequestHandler,
+            HTTP_SETTINGS.handler_threads,
+            HTTP_SETTINGS.max_connections,
+        )
+    else:
+        # One request at a time
+        httpd = HTTPServer(server_address, testHTTPServer_RequestHandler)
     print("running server...")
     httpd.serve_forever()
 
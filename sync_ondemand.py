@@ -1,87 +1,225 @@
-import sys
+import argparse
+import contextlib
 import json
 import datetime
+import os
+import socket
+import time
 import traceback
 from urllib.parse import urlparse
 import ps_core
+import ps_metrics
+import ps_state
 
 # Additional modules imported below if sending error email becomes necessary
 
-# Attempt a sync; send failure email with traceback if error.
-# Name of configuration is file passed via command-line
-if __name__ == "__main__":
+
+def send_failure_email(config_path, current_record):
+    """Send failure email with traceback of the exception currently being handled."""
+    with open(config_path) as config_file:
+        config = json.load(config_file)
+        email_config = config["email"]
+        if current_record:
+            slate_domain = urlparse(config["slate_query_apps"]["url"]).netloc
+            current_record_link = (
+                "https://"
+                + slate_domain
+                + "/manage/lookup/record?id="
+                + str(current_record)
+            )
+        else:
+            current_record_link = "None"
+    print(
+        "Exception at " + str(datetime.datetime.now()) + "! Check notification email."
+    )
+    body = (
+        "Sync failed at "
+        + str(datetime.datetime.now())
+        + "\n\nError: "
+        + str(traceback.format_exc())
+        + "\nCurrent Record: "
+        + current_record_link
+        + "\n\nRun report:\n"
+        + ps_metrics.summary()
+    )
+
+    if email_config["method"] == "o365":
+        from O365 import Account
+
+        credentials = (
+            email_config["o365"]["oauth_application"],
+            email_config["o365"]["oauth_secret"],
+        )
+        account = Account(credentials, tenant_id=email_config["o365"]["tenant_id"])
+        if not account.is_authenticated:
+            # Interactive authentication is required during setup
+            account.authenticate(scopes=["basic", "Mail.Send"])
+
+        m = account.new_message()
+        for recipient in email_config["to"].split(","):
+            m.to.add(recipient.strip())
+        m.subject = email_config["subject"]
+        m.body = body.replace("\n", "<br>")
+        m.send()
+    elif email_config["method"] == "smtp":
+        import smtplib
+        from email.mime.text import MIMEText
+
+        msg = MIMEText(body)
+        msg["To"] = email_config["to"]
+        msg["From"] = email_config["from"]
+        msg["Subject"] = email_config["subject"]
+
+        with smtplib.SMTP(email_config["server"]) as smtp:
+            smtp.starttls()
+            smtp.login(
+                email_config["smtp"]["username"], email_config["smtp"]["password"]
+            )
+            smtp.send_message(msg)
+
+
+def get_current_record():
+    # There's got to be a better way to handle this.
+    try:
+        return ps_core.CURRENT_RECORD
+    except AttributeError:
+        return None
+
+
+def locked_sync(owner):
+    """Run main_sync unless another scheduled run holds the sync lock. Return False if skipped."""
+    settings = ps_core.SETTINGS.scheduler
+    if settings.prevent_overlap:
+        if not ps_state.acquire_lock(
+            "scheduled_sync", owner, settings.lock_ttl_minutes * 60
+        ):
+            print("Another sync is still running. Skipping this run.")
+            return False
+
     try:
-        print("Start sync at " + str(datetime.datetime.now()))
-        ps_core.init(sys.argv[1])
         ps_core.main_sync()
+        ps_core.verbose_print(ps_metrics.summary())
+    finally:
+        if settings.prevent_overlap:
+            ps_state.release_lock("scheduled_sync", owner)
+        # Shown by the sync server's /metrics endpoint
+        run = ps_metrics.last_run()
+        if run is not None:
+            ps_state.save_run(
+                "scheduled", run["started"], run["seconds"], run["status"]
+            )
+
+    return True
+
+
+def run_once(config_path):
+    """Attempt a sync; send failure email with traceback if error."""
+    owner = socket.gethostname() + ":" + str(os.getpid())
+    try:
+        print("Start sync at " + str(datetime.datetime.now()))
+        ps_core.init(config_path)
+        locked_sync(owner)
         print("Done at " + str(datetime.datetime.now()))
     except Exception as e:
-        # There's got to be a better way to handle this.
-        try:
-            current_record = ps_core.CURRENT_RECORD
-        except AttributeError:
-            current_record = None
+        current_record = get_current_record()
 
         # Close SQL connections
         ps_core.de_init()
 
-        with open(sys.argv[1]) as config_file:
-            config = json.load(config_file)
-            email_config = config["email"]
-            if current_record:
-                slate_domain = urlparse(config["slate_query_apps"]["url"]).netloc
-                current_record_link = (
-                    "https://"
-                    + slate_domain
-                    + "/manage/lookup/record?id="
-                    + str(current_record)
-                )
-            else:
-                current_record_link = "None"
-        print(
-            "Exception at "
-            + str(datetime.datetime.now())
-            + "! Check notification email."
-        )
-        body = (
-            "Sync failed at "
-            + str(datetime.datetime.now())
-            + "\n\nError: "
-            + str(traceback.format_exc())
-            + "\nCurrent Record: "
-            + current_record_link
-        )
+        send_failure_email(config_path, current_record)
 
-        if email_config["method"] == "o365":
-            from O365 import Account
 
-            credentials = (
-                email_config["o365"]["oauth_application"],
-                email_config["o365"]["oauth_secret"],
-            )
-            account = Account(credentials, tenant_id=email_config["o365"]["tenant_id"])
-            if not account.is_authenticated:
-                # Interactive authentication is required during setup
-                account.authenticate(scopes=["basic", "Mail.Send"])
-
-            m = account.new_message()
-            for recipient in email_config["to"].split(","):
-                m.to.add(recipient.strip())
-            m.subject = email_config["subject"]
-            m.body = body.replace("\n", "<br>")
-            m.send()
-        elif email_config["method"] == "smtp":
-            import smtplib
-            from email.mime.text import MIMEText
-
-            msg = MIMEText(body)
-            msg["To"] = email_config["to"]
-            msg["From"] = email_config["from"]
-            msg["Subject"] = email_config["subject"]
-
-            with smtplib.SMTP(email_config["server"]) as smtp:
-                smtp.starttls()
-                smtp.login(
-                    email_config["smtp"]["username"], email_config["smtp"]["password"]
-                )
-                smtp.send_message(msg)
+def notify_failure(config_path, current_record):
+    """Send the failure email, printing rather than raising if that fails too, so the daemon keeps running."""
+    try:
+        send_failure_email(config_path, current_record)
+    except Exception:
+        print("Failed to send failure email:", traceback.format_exc())
+
+
+def run_daemon(config_path):
+    """Sync on a fixed interval, keeping config, mappings, and connections warm between runs.
+
+    Runs never overlap: a run that overruns the interval delays the next one.
+    Failures send the same email as a single run, then connections are reset before the next run.
+    If start-up fails, such as when the database is unreachable, it is retried on the next interval.
+    """
+    owner = socket.gethostname() + ":" + str(os.getpid())
+    initialized = False
+    # Until the config has been read, retry on the default interval
+    interval = 15 * 60
+
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                if not initialized:
+                    ps_core.init(config_path)
+                    initialized = True
+                    interval = ps_core.SETTINGS.scheduler.interval_minutes * 60
+                    print(
+                        "Daemon started. Syncing every " + str(interval) + " seconds."
+                    )
+
+                print("Start sync at " + str(datetime.datetime.now()))
+                ps_core.reload_mapping_if_changed()
+                locked_sync(owner)
+                print("Done at " + str(datetime.datetime.now()))
+            except Exception as e:
+                current_record = get_current_record()
+                notify_failure(config_path, current_record)
+
+                # Reset connections. Fall back to a full re-init on the next run if that fails too.
+                if initialized:
+                    try:
+                        ps_core.recover()
+                    except Exception:
+                        print(
+                            "Recovery failed, re-initializing:", traceback.format_exc()
+                        )
+                        initialized = False
+                if not initialized:
+                    # Close whatever a failed start-up or recovery left open
+                    try:
+                        ps_core.de_init()
+                    except Exception:
+                        pass
+
+            time.sleep(max(0, started + interval - time.monotonic()))
+    except KeyboardInterrupt:
+        print("Daemon stopped at " + str(datetime.datetime.now()))
+    finally:
+        if initialized:
+            ps_core.de_init()
+
+
+# Name of configuration is file passed via command-line
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Sync applications between Slate and PowerCampus."
+    )
+    parser.add_argument("config", help="path to the configuration file")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep running and sync every scheduler.interval_minutes",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="write a CPU and memory profile of the run to this file",
+    )
+    args = parser.parse_args()
+
+    if args.profile:
+        import ps_profile
+
+        profile = ps_profile.profiled(args.profile, "sync_ondemand")
+    else:
+        profile = contextlib.nullcontext()
+
+    with profile:
+        if args.daemon:
+            run_daemon(args.config)
+        else:
+            run_once(args.config)
@@ -1,11 +1,14 @@
-import sys
+import argparse
+import contextlib
 import requests
 import json
 import datetime
+import time
 import pyodbc
 import traceback
 import smtplib
 from email.mime.text import MIMEText
+import ps_state
 
 
 def init_config(x):
@@ -17,6 +20,9 @@ def init_config(x):
     global s_upload_url
     global s_upload_cred
     global smtp_config
+    global incremental
+    global batch
+    global session
     global cnxn
     global cursor
     global today
@@ -41,6 +47,18 @@ def init_config(x):
     # Email crash handler notification settings
     smtp_config = config["smtp"]
 
+    # Only upload new or changed ISIRs, remembering what was sent in a local SQLite file
+    incremental = {"enabled": False, "max_age_hours": None, "skip_settled_days": None}
+    incremental.update(config.get("incremental", {}))
+    ps_state.init(config.get("local_state", {}).get("database", "powerslate_state.db"))
+
+    # Look up ISIRs with a set-based procedure and upload them in chunks
+    batch = {"enabled": False, "lookup_size": 500, "upload_size": 1000}
+    batch.update(config.get("batch", {}))
+
+    # Reuse one connection to Slate for chunked uploads
+    session = requests.Session()
+
     # Microsoft SQL Server connection. Requires ODBC connection provisioned on the local machine.
     cnxn = pyodbc.connect(config["pf_database_string"])
     cursor = cnxn.cursor()
@@ -49,6 +67,52 @@ def init_config(x):
 def de_init():
     # Clean up connections.
     cnxn.close()  # SQL
+    session.close()  # HTTP
+    ps_state.de_init()
+
+
+def isir_key(k):
+    return str(k["pid"]) + ":" + str(k["govid"])
+
+
+def select_isirs(x):
+    """Look up the most recent ISIR for each row from Slate. Yields (row, ISIR) for rows that have one.
+
+    With batch.enabled, government IDs are looked up batch.lookup_size at a time with [custom].[PS_selISIRBatch].
+    """
+    if not batch["enabled"]:
+        # Execute SQL stored precedure for each id
+        for k in x:
+            cursor.execute("EXEC [custom].[PS_selISIR] ?", k["govid"])
+            row = cursor.fetchone()
+
+            # If the stored procedure returns something, pass it on
+            if row is not None:
+                yield k, row.ISIR
+        return
+
+    for start in range(0, len(x), batch["lookup_size"]):
+        chunk = x[start : start + batch["lookup_size"]]
+        cursor.execute(
+            "EXEC [custom].[PS_selISIRBatch] ?",
+            json.dumps([{"i": i, "govid": k["govid"]} for i, k in enumerate(chunk)]),
+        )
+        for row in cursor.fetchall():
+            yield chunk[row.KeyIndex], row.ISIR
+
+
+def slate_upload(slate_upload_list, upload_hashes):
+    """Upload a list of ISIRs to Slate, then remember their hashes if incremental uploads are enabled."""
+    # Slate must have a root element for some reason, so nest the dict inside another dict and list.
+    slate_upload_dict = {"row": slate_upload_list}
+
+    # Upload dict back to Slate
+    r = session.post(s_upload_url, json=slate_upload_dict, auth=s_upload_cred)
+    r.raise_for_status()
+
+    # Remember what was uploaded only once Slate has accepted it
+    if len(upload_hashes) > 0:
+        ps_state.save_hashes("isir", upload_hashes)
 
 
 def doit(config_file):
@@ -62,31 +126,91 @@ def doit(config_file):
     # Convert Slate JSON response into Python list.
     # Since the initial Slate response is a dict with a single key, isolate the single value, which is a list.
     x = json.loads(r.text)["row"]
+    total = len(x)
+    uploaded = 0
+
+    # Hashes of ISIRs already uploaded, keyed by pid and govid: (hash, uploaded, last changed)
+    if incremental["enabled"]:
+        saved = ps_state.get_hashes("isir")
+        now = time.time()
+
+        # ISIRs that haven't changed in a long time are settled; don't look them up again.
+        if incremental["skip_settled_days"] is not None:
+            settled_age = incremental["skip_settled_days"] * 86400
+            x = [
+                k
+                for k in x
+                if isir_key(k) not in saved
+                or now - saved[isir_key(k)][2] <= settled_age
+            ]
+
+    # Upload in chunks of batch.upload_size as results arrive, rather than holding every ISIR in memory
     slate_upload_list = []
+    upload_hashes = []
+    for k, isir in select_isirs(x):
+        item = {"pid": k["pid"], "isir": isir}
+
+        if incremental["enabled"]:
+            key = isir_key(k)
+            digest = ps_state.fingerprint(item)
+            # Skip ISIRs identical to the last upload, unless that was more than max_age_hours ago
+            if (
+                key in saved
+                and saved[key][0] == digest
+                and (
+                    incremental["max_age_hours"] is None
+                    or now - saved[key][1] < incremental["max_age_hours"] * 3600
+                )
+            ):
+                continue
+            upload_hashes.append((key, digest))
+
+        slate_upload_list.append(item)
+        if batch["enabled"] and len(slate_upload_list) >= batch["upload_size"]:
+            slate_upload(slate_upload_list, upload_hashes)
+            uploaded += len(slate_upload_list)
+            slate_upload_list = []
+            upload_hashes = []
+
+    if len(slate_upload_list) > 0:
+        slate_upload(slate_upload_list, upload_hashes)
+        uploaded += len(slate_upload_list)
 
-    # Execute SQL stored precedure for each id and add result to list to be uploaded back to Slate.
-    for k, v in enumerate(x):
-        cursor.execute("EXEC [custom].[PS_selISIR] ?", x[k]["govid"])
-        row = cursor.fetchone()
+    print(
+        "Uploaded "
+        + str(uploaded)
+        + " of "
+        + str(total)
+        + " ISIRs at "
+        + str(datetime.datetime.now())
+    )
 
-        # If the stored procedure returns something, append that to new list
-        if row is not None:
-            slate_upload_list.append({"pid": x[k]["pid"], "isir": row.ISIR})
+    de_init()
 
-    # Slate must have a root element for some reason, so nest the dict inside another dict and list.
-    slate_upload_dict = {"row": slate_upload_list}
 
-    # Upload dict back to Slate
-    r = requests.post(s_upload_url, json=slate_upload_dict, auth=s_upload_cred)
-    r.raise_for_status()
+parser = argparse.ArgumentParser(
+    description="Upload ISIR data from PowerFAIDS to Slate."
+)
+parser.add_argument("config", help="path to the configuration file")
+parser.add_argument(
+    "--profile",
+    metavar="PATH",
+    help="write a CPU and memory profile of the run to this file",
+)
+args = parser.parse_args()
 
-    de_init()
+if args.profile:
+    import ps_profile
 
+    profile = ps_profile.profiled(args.profile, "upload_isir")
+else:
+    profile = contextlib.nullcontext()
 
 # Attempt a sync; send failure email with traceback if error.
 try:
     print("Start sync at " + str(datetime.datetime.now()))
-    doit(sys.argv[1])
+    with profile:
+        doit(args.config)
 except Exception as e:
     # Send a failure email with traceback on exceptions
     print(